@@ -234,14 +234,31 @@ namespace Pax
 
           PaxConfig.interface_lead_handler[idx] = i.lead_handler;
 
-          foreach (var device in devices)
+          foreach (var found_device in devices)
           {
-            if (device.Name == i.interface_name)
+            if (found_device.Name == i.interface_name)
             {
+              ICaptureDevice device = found_device;
+              // SharpPcap can't apply all the capture settings, so we open
+              // the device ourselves if they're used.
+              if (TunedLibPcapLiveDevice.NeedsTuning(i) && device is LibPcapLiveDevice)
+              {
+                device = new TunedLibPcapLiveDevice(((LibPcapLiveDevice)device).Interface, i);
+              }
+
               PaxConfig.deviceMap[idx] = device;
               PaxConfig.rdeviceMap.Add(device.Name, idx);
-              // Configure this device's read timeout
-              device.Open(DeviceMode.Normal, i.read_timeout);
+              // Configure this device's capture mode and read timeout
+              device.Open(i.promiscuous ? DeviceMode.Promiscuous : DeviceMode.Normal, i.read_timeout);
+
+              if (!PaxConfig.opt_quiet && PaxConfig.opt_verbose) {
+                print_kv (indent + indent + "Promiscuous: ", i.promiscuous.ToString());
+                print_kv (indent + indent + "Immediate mode: ", i.immediate_mode.ToString());
+                print_kv (indent + indent + "Kernel buffer size: ",
+                    i.kernel_buffer_size > 0 ? i.kernel_buffer_size.ToString() : "default");
+                print_kv (indent + indent + "Snaplen: ",
+                    i.snaplen > 0 ? i.snaplen.ToString() : "default");
+              }
 
               if (!String.IsNullOrEmpty(i.pcap_filter))
               {
@@ -414,6 +431,8 @@ namespace Pax
         });
       // Shutdown on ^C -- FIXME remove handling of ^C or ^D?
       Console.CancelKeyPress += new ConsoleCancelEventHandler(shutdown);
+      if (Environment.OSVersion.Platform == PlatformID.Unix)
+        RegisterUnixSignalHandlers();
       for (int idx = 0; idx < PaxConfig_Lite.no_interfaces; idx++)
       {
         if (PaxConfig.interface_lead_handler_obj[idx] == null)
@@ -477,9 +496,51 @@ namespace Pax
       }
     }
 
+    // Mono.Posix comes with Mono, but not with other runtimes, so rather than
+    // referencing it (which would stop Pax building without Mono) it's loaded
+    // when it's available.
+    private const string MonoPosixAssembly = "Mono.Posix, Version=4.0.0.0, Culture=neutral, PublicKeyToken=0738eb9f132ed756";
+
+    // ^C only reaches CancelKeyPress if Pax is attached to a terminal, so on
+    // Unix we also shut down on SIGINT and SIGTERM directly -- e.g., when Pax
+    // is started by a script with its input and output redirected.
+    private static void RegisterUnixSignalHandlers()
+    {
+      Type unix_signal = Type.GetType("Mono.Unix.UnixSignal, " + MonoPosixAssembly);
+      Type signum = Type.GetType("Mono.Unix.Native.Signum, " + MonoPosixAssembly);
+      if (unix_signal == null || signum == null)
+        return;
+
+      Array signals = Array.CreateInstance(unix_signal, 2);
+      signals.SetValue(Activator.CreateInstance(unix_signal, new object[] { Enum.Parse(signum, "SIGINT") }), 0);
+      signals.SetValue(Activator.CreateInstance(unix_signal, new object[] { Enum.Parse(signum, "SIGTERM") }), 1);
+      // UnixSignal.WaitAny(UnixSignal[]) blocks until one of the signals arrives.
+      MethodInfo wait_any = unix_signal.GetMethod("WaitAny", new Type[] { signals.GetType() });
+
+      Thread t = new Thread (() =>
+        {
+          wait_any.Invoke(null, new object[] { signals });
+          shutdown(null, null);
+          Environment.Exit(0);
+        });
+      t.IsBackground = true;
+      t.Start();
+    }
+
+    // Set once shutdown has started, since it can be triggered from several places.
+    private static int shutting_down = 0;
+
+    // Raised during shutdown once every interface has been stopped and closed,
+    // so no more packets will be processed -- e.g., for packet processors that
+    // save their state.
+    public static event Action OnShutdown;
+
     //Cleanup
     private static void shutdown (object sender, ConsoleCancelEventArgs args)
     {
+      if (Interlocked.Exchange(ref shutting_down, 1) == 1)
+        return;
+
       for (int idx = 0; idx < PaxConfig_Lite.no_interfaces; idx++)
       {
         // If the packet processor is "active" then stop it now.
@@ -495,6 +556,14 @@ namespace Pax
         PaxConfig.deviceMap[idx].Close();
       }
 
+      OnShutdown?.Invoke();
+
+      if (PaxConfig.opt_verbose && !PaxConfig.opt_quiet) {
+        // Show how much garbage collection went on while processing packets.
+        Console.WriteLine ("GC collections: gen0={0} gen1={1} gen2={2}",
+          GC.CollectionCount(0), GC.CollectionCount(1), GC.CollectionCount(2));
+      }
+
       if (!PaxConfig.opt_quiet) {
         if (!PaxConfig.opt_no_colours)
           Console.ResetColor();
@@ -50,6 +50,26 @@ namespace Pax
     [DefaultValue(100)]
     public int read_timeout { get; set; }
 
+    // Capture tuning knobs. These are handed to libpcap when the device is
+    // opened; the defaults leave libpcap's own settings untouched.
+    // Whether to put the interface into promiscuous mode.
+    [DefaultValue(false)]
+    public bool promiscuous { get; set; }
+    // Size (in bytes) of the kernel's capture buffer. On Linux this is the
+    // size of the memory-mapped (PACKET_MMAP) ring that libpcap captures into.
+    // 0 means use libpcap's default.
+    [DefaultValue(0)]
+    public int kernel_buffer_size { get; set; }
+    // Number of bytes captured from each frame. 0 means capture whole frames.
+    // NOTE frames are forwarded as captured, so setting this below the MTU
+    //      is only sensible for monitors.
+    [DefaultValue(0)]
+    public int snaplen { get; set; }
+    // Deliver each packet as soon as it arrives, rather than letting the
+    // kernel batch them until the buffer fills or read_timeout expires.
+    [DefaultValue(false)]
+    public bool immediate_mode { get; set; }
+
     public IDictionary<string, string> environment {get; set;}
   }
 
@@ -72,7 +72,10 @@ namespace Pax {
       var packet = PacketDotNet.Packet.ParsePacket(e.Packet.LinkLayerType, e.Packet.Data);
       int in_port = PaxConfig.rdeviceMap[e.Device.Name];
 
-      Debug.Assert(process_packet (in_port, ref packet) is ForwardingDecision.Drop);
+      // NOTE process_packet must be called outside Debug.Assert, since calls
+      //      to Debug.Assert are left out of builds that don't define DEBUG.
+      ForwardingDecision des = process_packet (in_port, ref packet);
+      Debug.Assert(des is ForwardingDecision.Drop);
 #if DEBUG
       // FIXME could append name of the class in the debug message, so we know which
       //       packet processor is being used.
@@ -103,18 +106,7 @@ namespace Pax {
 #if DEBUG
       Debug.Write(PaxConfig.deviceMap[in_port].Name + " -1> ");
 #endif
-      if (out_port > -1)
-      {
-        var device = PaxConfig.deviceMap[out_port];
-        if (packet is EthernetPacket)
-          ((EthernetPacket)packet).SourceHwAddress = device.MacAddress;
-        device.SendPacket(packet);
-#if DEBUG
-        Debug.WriteLine(PaxConfig.deviceMap[out_port].Name);
-      } else {
-        Debug.WriteLine("<dropped>");
-#endif
-      }
+      PacketForwarding.send_to_port (packet, out_port);
     }
   }
 
@@ -149,6 +141,91 @@ namespace Pax {
 
 #if DEBUG
       Debug.Write(PaxConfig.deviceMap[in_port].Name + " -> ");
+#endif
+      PacketForwarding.send_to_ports (packet, out_ports);
+    }
+  }
+
+  public class PacketProcessor_Chain : IPacketProcessor {
+    List<IPacketProcessor> chain;
+    // In a "fused" chain the packet is parsed once, passed through each
+    // element's process_packet, and only the last element's forwarding decision
+    // is acted on. Otherwise each element handles the packet independently
+    // (parsing it, and forwarding it, itself) through its packetHandler.
+    // NOTE fusing changes the chain's behaviour if elements other than the last
+    //      one forward packets (e.g., a Mirror followed by a switch), or if
+    //      elements don't implement process_packet (e.g., ByteBased_PacketProcessor).
+    bool fused;
+
+    public PacketProcessor_Chain (List<IPacketProcessor> chain, bool fused = false) {
+      this.chain = chain;
+      this.fused = fused;
+    }
+
+    public void packetHandler (object sender, CaptureEventArgs e) {
+      if (!fused) {
+        foreach (IPacketProcessor pp in chain) {
+          pp.packetHandler (sender, e);
+        }
+        return;
+      }
+
+      var packet = PacketDotNet.Packet.ParsePacket(e.Packet.LinkLayerType, e.Packet.Data);
+      int in_port = PaxConfig.rdeviceMap[e.Device.Name];
+
+      ForwardingDecision des = process_packet (in_port, ref packet);
+
+#if DEBUG
+      Debug.Write(PaxConfig.deviceMap[in_port].Name + " -" + chain.Count.ToString() + "-> ");
+#endif
+      if (des is ForwardingDecision.SinglePortForward) {
+        PacketForwarding.send_to_port (packet, ((ForwardingDecision.SinglePortForward)des).target_port);
+      } else if (des is ForwardingDecision.MultiPortForward) {
+        PacketForwarding.send_to_ports (packet, ((ForwardingDecision.MultiPortForward)des).target_ports);
+      } else {
+        // The decision was to drop the packet (or the chain was empty).
+#if DEBUG
+        Debug.WriteLine("<dropped>");
+#endif
+      }
+    }
+
+    public ForwardingDecision process_packet (int in_port, ref Packet packet)
+    {
+      ForwardingDecision fd = null;
+
+      //We return the ForwardingDecision made by the last element in the chain.
+      foreach (IPacketProcessor pp in chain) {
+        fd = pp.process_packet (in_port, ref packet);
+      }
+
+      return fd;
+    }
+  }
+
+  // Sends packets out according to a forwarding decision. This is shared by the
+  // packet processors above that parse a packet and act on what process_packet returned.
+  internal static class PacketForwarding {
+    // Send "packet" out through "out_port", after setting its source MAC address
+    // to that interface's. A negative "out_port" means that the packet is dropped.
+    public static void send_to_port (Packet packet, int out_port) {
+      if (out_port > -1)
+      {
+        var device = PaxConfig.deviceMap[out_port];
+        if (packet is EthernetPacket)
+          ((EthernetPacket)packet).SourceHwAddress = device.MacAddress;
+        device.SendPacket(packet);
+#if DEBUG
+        Debug.WriteLine(device.Name);
+      } else {
+        Debug.WriteLine("<dropped>");
+#endif
+      }
+    }
+
+    // Send "packet" out through each of "out_ports", unchanged.
+    public static void send_to_ports (Packet packet, int[] out_ports) {
+#if DEBUG
       // It's useful to know the width of the returned array during debugging,
       // since it might be that the array was wider than intended, and contained
       // repeated or rubbish values.
@@ -171,8 +248,7 @@ namespace Pax {
              Debug.Write(PaxConfig.deviceMap[out_port].Name);
           }
 #endif
-        } else if (!(out_port < PaxConfig_Lite.no_interfaces) &&
-            !PaxConfig_Lite.ignore_phantom_forwarding) {
+        } else if (!PaxConfig_Lite.ignore_phantom_forwarding) {
           throw (new Exception ("Tried forward to non-existant port"));
         }
       }
@@ -183,32 +259,6 @@ namespace Pax {
     }
   }
 
-  public class PacketProcessor_Chain : IPacketProcessor {
-    List<IPacketProcessor> chain;
-
-    public PacketProcessor_Chain (List<IPacketProcessor> chain) {
-      this.chain = chain;
-    }
-
-    public void packetHandler (object sender, CaptureEventArgs e) {
-      foreach (IPacketProcessor pp in chain) {
-        pp.packetHandler (sender, e);
-      }
-    }
-
-    public ForwardingDecision process_packet (int in_port, ref Packet packet)
-    {
-      ForwardingDecision fd = null;
-
-      //We return the ForwardingDecision made by the last element in the chain.
-      foreach (IPacketProcessor pp in chain) {
-        fd = pp.process_packet (in_port, ref packet);
-      }
-
-      return fd;
-    }
-  }
-
   public interface IActive {
     // NOTE "PreStart" and "Start" might be called multiple times -- once for
     //      each device to which a packet processor is associated with.
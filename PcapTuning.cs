@@ -0,0 +1,135 @@
+/*
+Pax : tool support for prototyping packet processors
+Capture tuning for libpcap-backed network interfaces.
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+*/
+
+using System;
+using System.Runtime.InteropServices;
+using System.Text;
+using SharpPcap;
+using SharpPcap.LibPcap;
+
+namespace Pax
+{
+  // SharpPcap opens live devices with a fixed snaplen and doesn't expose
+  // libpcap's buffer-size or immediate-mode settings. These can only be set
+  // between pcap_create and pcap_activate, so this device does the opening
+  // itself and otherwise behaves just like the LibPcapLiveDevice it replaces.
+  public class TunedLibPcapLiveDevice : LibPcapLiveDevice
+  {
+    private const int PCAP_ERRBUF_SIZE = 256;
+    // Used when the configuration doesn't specify a snaplen.
+    private const int MAX_SNAPLEN = 65536;
+
+    private readonly NetworkInterfaceConfig tuning;
+
+    public TunedLibPcapLiveDevice (PcapInterface pcapIf, NetworkInterfaceConfig tuning)
+      : base(pcapIf)
+    {
+      this.tuning = tuning;
+    }
+
+    // Whether "conf" asks for anything that SharpPcap can't set by itself.
+    public static bool NeedsTuning (NetworkInterfaceConfig conf)
+    {
+      return (conf.kernel_buffer_size > 0 || conf.snaplen > 0 || conf.immediate_mode);
+    }
+
+    public override void Open (DeviceMode mode, int read_timeout)
+    {
+      Open(mode, read_timeout, MonitorMode.Inactive);
+    }
+
+    public override void Open (DeviceMode mode, int read_timeout, MonitorMode monitor_mode)
+    {
+      if (Opened)
+        return;
+
+      // Like SharpPcap, allow twice the read timeout before considering the
+      // capture thread to be stuck.
+      StopCaptureTimeout = TimeSpan.FromMilliseconds(read_timeout * 2);
+
+      StringBuilder errbuf = new StringBuilder(PCAP_ERRBUF_SIZE);
+      IntPtr handle = pcap_create(Name, errbuf);
+      if (handle == IntPtr.Zero)
+      {
+        throw (new Exception ("Unable to open " + Name + ": " + errbuf.ToString()));
+      }
+
+      // A setting that can't be applied is an error rather than being dropped,
+      // since otherwise results would be attributed to settings that weren't in effect.
+      try
+      {
+        check_setting(pcap_set_snaplen(handle, tuning.snaplen > 0 ? tuning.snaplen : MAX_SNAPLEN), "snaplen");
+        check_setting(pcap_set_promisc(handle, mode == DeviceMode.Promiscuous ? 1 : 0), "promiscuous mode");
+        check_setting(pcap_set_timeout(handle, read_timeout), "read timeout");
+        if (monitor_mode == MonitorMode.Active)
+          check_setting(pcap_set_rfmon(handle, 1), "monitor mode");
+        if (tuning.kernel_buffer_size > 0)
+          check_setting(pcap_set_buffer_size(handle, tuning.kernel_buffer_size), "kernel buffer size");
+        if (tuning.immediate_mode)
+          check_setting(pcap_set_immediate_mode(handle, 1), "immediate mode");
+      }
+      catch (EntryPointNotFoundException ex)
+      {
+        pcap_close(handle);
+        // E.g., pcap_set_immediate_mode was added in libpcap 1.5.0.
+        // The exception's message names the missing function.
+        throw (new Exception ("Unable to tune " + Name + ": not supported by this libpcap (" + ex.Message + ")"));
+      }
+      catch
+      {
+        pcap_close(handle);
+        throw;
+      }
+
+      // Negative values are errors; positive values are warnings, which
+      // (as in SharpPcap) we don't treat as fatal.
+      int result = pcap_activate(handle);
+      if (result < 0)
+      {
+        string err = Marshal.PtrToStringAnsi(pcap_geterr(handle));
+        pcap_close(handle);
+        throw (new Exception ("Unable to activate " + Name + ": " + err));
+      }
+
+      // PcapHandle can't be set from outside SharpPcap, so record the handle in
+      // the protected field behind it, which Opened, capturing and sending use.
+      m_pcapAdapterHandle = handle;
+    }
+
+    // The pcap_set_* functions return 0 on success, and a negative error code otherwise.
+    private void check_setting (int result, string setting)
+    {
+      if (result != 0)
+        throw (new Exception ("Unable to set " + setting + " on " + Name + " (libpcap error " + result + ")"));
+    }
+
+    // These are mapped to the system's libpcap in the same way as for SharpPcap
+    // (see lib/SharpPcap.dll.config).
+    private const string PCAP_DLL = "wpcap";
+
+    [DllImport(PCAP_DLL, CharSet = CharSet.Ansi)]
+    private extern static IntPtr pcap_create (string dev, StringBuilder errbuf);
+    [DllImport(PCAP_DLL)]
+    private extern static int pcap_set_snaplen (IntPtr p, int snaplen);
+    [DllImport(PCAP_DLL)]
+    private extern static int pcap_set_promisc (IntPtr p, int promisc);
+    [DllImport(PCAP_DLL)]
+    private extern static int pcap_set_timeout (IntPtr p, int to_ms);
+    [DllImport(PCAP_DLL)]
+    private extern static int pcap_set_rfmon (IntPtr p, int rfmon);
+    [DllImport(PCAP_DLL)]
+    private extern static int pcap_set_buffer_size (IntPtr p, int buffer_size);
+    [DllImport(PCAP_DLL)]
+    private extern static int pcap_set_immediate_mode (IntPtr p, int immediate_mode);
+    [DllImport(PCAP_DLL)]
+    private extern static int pcap_activate (IntPtr p);
+    [DllImport(PCAP_DLL)]
+    private extern static IntPtr pcap_geterr (IntPtr p);
+    [DllImport(PCAP_DLL)]
+    private extern static void pcap_close (IntPtr p);
+  }
+}
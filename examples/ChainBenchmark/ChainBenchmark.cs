@@ -0,0 +1,79 @@
+/*
+Chain of packet processors used to measure the per-stage overhead of chaining.
+
+Packets are forwarded between ports 0 and 1 through a chain of "stages" elements:
+(stages - 1) monitors that only look at the packet, followed by a Mirror that
+forwards the packet to the other port. The chain can be run fused or not (see
+PacketProcessor_Chain), so the benchmark shows what each stage costs in both cases.
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+*/
+
+using System;
+using System.Collections.Generic;
+using System.Diagnostics;
+using System.Threading;
+using PacketDotNet;
+using SharpPcap;
+
+using Pax;
+
+// A monitor that counts the packets it sees.
+public class PacketCounter : PacketMonitor {
+  private long count = 0;
+
+  public long Count {
+    get { return Interlocked.Read(ref count); }
+  }
+
+  override public ForwardingDecision process_packet (int in_port, ref Packet packet)
+  {
+    Interlocked.Increment(ref count);
+    return ForwardingDecision.Drop.Instance;
+  }
+}
+
+public class ChainBenchmark : IPacketProcessor {
+  IPacketProcessor pp;
+#if DEBUG
+  // In DEBUG builds each stage also writes debug output for every packet, which
+  // swamps the cost of the stages themselves.
+  const string debug_build_warning = "WARNING: ChainBenchmark was built with DEBUG, so its measurements include per-packet debug output";
+#endif
+
+  public ChainBenchmark (int stages, bool fused) {
+    Debug.Assert(stages >= 1);
+    Debug.Assert(PaxConfig_Lite.no_interfaces >= 2);
+#if DEBUG
+    // NOTE mn_chain_benchmark.py looks for this warning in Pax's output, and
+    //      stops if it finds it.
+    Console.WriteLine(debug_build_warning);
+#endif
+
+    var chain = new List<IPacketProcessor>();
+    // Alternate between the two kinds of monitor.
+    for (int i = 0; i < stages - 1; i++) {
+      if (i % 2 == 0)
+        chain.Add(new Dropper());
+      else
+        chain.Add(new PacketCounter());
+    }
+
+    // The last stage connects ports 0 and 1 like a wire.
+    ForwardingDecision[] wire = Mirror.InitialConfig(PaxConfig_Lite.no_interfaces);
+    wire[0] = new ForwardingDecision.SinglePortForward(1);
+    wire[1] = new ForwardingDecision.SinglePortForward(0);
+    chain.Add(new Mirror(wire));
+
+    this.pp = new PacketProcessor_Chain(chain, fused);
+  }
+
+  public void packetHandler (object sender, CaptureEventArgs e) {
+    pp.packetHandler (sender, e);
+  }
+
+  public ForwardingDecision process_packet (int in_port, ref Packet packet)
+  {
+    return (pp.process_packet (in_port, ref packet));
+  }
+}
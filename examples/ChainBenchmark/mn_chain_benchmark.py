@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: latin-1
+
+# Mininet benchmark for PacketProcessor_Chain
+#
+# Runs ChainBenchmark with 1, 4 and 16 stages, fused and not, at a fixed offered
+# load, and reports the CPU time Pax spends on each forwarded packet and how
+# that grows with each additional stage.
+#
+# The examples must be built without DEBUG, otherwise every stage writes debug
+# output for every packet and that's what gets measured. Build them with e.g.
+#   $ DEFINE="TRACE LITE" ./build.sh
+#
+# Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+import argparse
+import json
+import os
+import tempfile
+import time
+
+PAX = None
+try:
+  PAX = os.environ['PAX']
+except KeyError:
+  print "PAX environment variable must point to path where Pax repo is cloned"
+  exit(1)
+
+import sys
+sys.path.insert(0, PAX + "/mininet/")
+from pax_mininet_node import PaxNode
+from pax_mininet_traffic import start_pax, stop_pax, cpu_seconds, pax_startup_wait
+
+stage_counts = [1, 4, 16]
+# Part of the warning that ChainBenchmark prints when it's started, if it was built with DEBUG.
+debug_build_warning = "ChainBenchmark was built with DEBUG"
+
+def write_wiring(node, stages, fused):
+  "Writes a copy of chain_benchmark.json that uses the given chain, and returns its filename."
+  with open(PAX + "/examples/ChainBenchmark/chain_benchmark.json") as f:
+    wiring = json.load(f)
+  wiring["handlers"][0]["args"] = {"stages": str(stages), "fused": str(fused).lower()}
+  # Pax also captures the packets it sends, so ignore those to avoid forwarding them back.
+  for intf in wiring["interfaces"]:
+    intf["pcap_filter"] += " and not ether src %s" % node.intf(intf["interface_name"]).MAC()
+  fd, filename = tempfile.mkstemp(prefix="pax_chain_", suffix=".json")
+  with os.fdopen(fd, "w") as f:
+    json.dump(wiring, f, indent=2)
+  return filename
+
+def rx_packets(host):
+  "Returns the number of packets received so far on the host's interface."
+  intf = host.defaultIntf().name
+  for line in host.cmd("cat /proc/net/dev").splitlines():
+    if line.strip().startswith(intf + ":"):
+      return int(line.split(":", 1)[1].split()[1])
+  raise Exception("No statistics for %s" % intf)
+
+def measure(net, stages, fused, config):
+  "Returns (forwarded packets per second, Pax CPU microseconds per forwarded packet)."
+  pax0, h1, h2 = net.get("pax0"), net.get("h1"), net.get("h2")
+  wiring = write_wiring(pax0, stages, fused)
+  fd, log = tempfile.mkstemp(prefix="pax_chain_", suffix=".log")
+  os.close(fd)
+  pax = start_pax(pax0, wiring, output_filename=log)
+  try:
+    time.sleep(pax_startup_wait)
+    with open(log) as f:
+      if debug_build_warning in f.read():
+        raise Exception("The examples were built with DEBUG, which would distort the measurements. " +
+                        "Rebuild them without it, e.g.: $ DEFINE=\"TRACE LITE\" ./build.sh")
+    rx_before = rx_packets(h2)
+    cpu_before = cpu_seconds(pax.pid)
+    h1.cmd("iperf -u -c %s -b %s -l %d -t %d" % (h2.IP(), config.rate, config.size, config.duration))
+    # Let Pax drain what it has queued.
+    time.sleep(1)
+    cpu = cpu_seconds(pax.pid) - cpu_before
+    forwarded = rx_packets(h2) - rx_before
+  finally:
+    stop_pax(pax)
+    os.remove(wiring)
+    os.remove(log)
+
+  if forwarded == 0:
+    return (0, None)
+  return (forwarded / float(config.duration), cpu * 1e6 / forwarded)
+
+def benchmark(config):
+  net = Mininet()
+  pax0 = net.addHost('pax0', cls=PaxNode)
+  h1 = net.addHost('h1', ip="10.0.0.1/24")
+  h2 = net.addHost('h2', ip="10.0.0.2/24")
+  net.addLink(h1, pax0, intfName2="pax0-eth0")
+  net.addLink(h2, pax0, intfName2="pax0-eth1")
+  net.start()
+
+  # Pax forwards whatever it's given, but doesn't answer ARP.
+  h1.setARP(h2.IP(), h2.MAC())
+  h2.setARP(h1.IP(), h1.MAC())
+  # Absorb the traffic on h2, so it doesn't send ICMP errors back through Pax.
+  h2.cmd("iperf -u -s &")
+
+  results = {}
+  try:
+    for fused in [False, True]:
+      for stages in stage_counts:
+        print "Running %d-stage chain (%s)" % (stages, "fused" if fused else "not fused")
+        results[(stages, fused)] = measure(net, stages, fused, config)
+        (pps, us) = results[(stages, fused)]
+        print "  forwarded %.0f pps, %s us of CPU per packet" % (pps, "-" if us is None else "%.2f" % us)
+  finally:
+    h2.cmd("kill %iperf")
+    net.stop()
+
+  print ""
+  print "stages  mode       pps        CPU us/pkt"
+  for fused in [False, True]:
+    for stages in stage_counts:
+      (pps, us) = results[(stages, fused)]
+      print "%6d  %-9s  %9.0f  %s" % (stages, "fused" if fused else "not fused", pps,
+                                      "-" if us is None else "%.2f" % us)
+
+  # The overhead of each stage is the slope between the shortest and longest chains.
+  print ""
+  for fused in [False, True]:
+    (_, first) = results[(stage_counts[0], fused)]
+    (_, last) = results[(stage_counts[-1], fused)]
+    if first is not None and last is not None:
+      print "Per-stage overhead (%s): %.3f us/pkt" % \
+        ("fused" if fused else "not fused", (last - first) / (stage_counts[-1] - stage_counts[0]))
+
+if __name__ == '__main__':
+  setLogLevel('warning')
+
+  parser = argparse.ArgumentParser(description="Benchmark fused and unfused chains of Pax packet processors.")
+  parser.add_argument("--rate", default="20M", help="offered load, in iperf's -b format")
+  parser.add_argument("--size", type=int, default=64, help="size in bytes of the UDP payloads sent")
+  parser.add_argument("--duration", type=int, default=10, help="seconds of load for each measurement")
+
+  benchmark(parser.parse_args())
@@ -0,0 +1,107 @@
+/*
+Pax : tool support for prototyping packet processors
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+*/
+
+using System;
+
+namespace Pax.Examples.Nat
+{
+  /// <summary>
+  /// A rewrite of one end (the source or the destination) of the packets travelling in one direction of a connection.
+  /// </summary>
+  /// <remarks>
+  /// Everything the rewrite needs is worked out when the connection is created: the bytes to write into the packet,
+  /// and how this changes the IP and transport-layer checksums (using the incremental update from RFC 1624).
+  /// Translating a packet then only involves writing into its bytes, and doesn't allocate.
+  /// </remarks>
+  internal sealed class AddressRewrite
+  {
+    /// <summary>
+    /// The MAC address to write.
+    /// </summary>
+    public readonly byte[] MacAddress;
+
+    /// <summary>
+    /// The IP address to write.
+    /// </summary>
+    public readonly byte[] Address;
+
+    /// <summary>
+    /// The port number to write, if <see cref="RewritesPort"/>.
+    /// </summary>
+    public readonly ushort Port;
+
+    /// <summary>
+    /// True if the port number changes.
+    /// </summary>
+    public readonly bool RewritesPort;
+
+    /// <summary>
+    /// The ones-complement sum to add to the IP header checksum.
+    /// </summary>
+    public readonly ushort NetworkChecksumDelta;
+
+    /// <summary>
+    /// The ones-complement sum to add to the transport-layer checksum. This also covers the IP addresses,
+    /// since they're part of the pseudo-header that the checksum is computed over.
+    /// </summary>
+    public readonly ushort TransportChecksumDelta;
+
+    /// <param name="from">The node whose addresses appear in packets before the rewrite.</param>
+    /// <param name="to">The node whose addresses should appear in packets after the rewrite.</param>
+    public AddressRewrite(Node from, Node to)
+    {
+      if (ReferenceEquals(null, from)) throw new ArgumentNullException(nameof(from));
+      if (ReferenceEquals(null, to)) throw new ArgumentNullException(nameof(to));
+
+      byte[] fromAddress = from.Address.GetAddressBytes();
+      MacAddress = to.MacAddress.GetAddressBytes();
+      Address = to.Address.GetAddressBytes();
+      Port = to.Key.Port;
+      RewritesPort = from.Key.Port != to.Key.Port;
+
+      if (fromAddress.Length != Address.Length)
+        throw new ArgumentException("Cannot rewrite addresses between IPv4 and IPv6");
+
+      uint sum = 0;
+      for (int i = 0; i < Address.Length; i += 2)
+        sum = AddReplacement(sum, Word(fromAddress, i), Word(Address, i));
+      NetworkChecksumDelta = Fold(sum);
+
+      if (RewritesPort)
+        sum = AddReplacement(sum, from.Key.Port, Port);
+      TransportChecksumDelta = Fold(sum);
+    }
+
+    /// <summary>
+    /// Updates the checksum stored at <paramref name="offset"/> in <paramref name="bytes"/> by adding <paramref name="delta"/>
+    /// (see RFC 1624, eqn. 3).
+    /// </summary>
+    public static void AdjustChecksum(byte[] bytes, int offset, ushort delta)
+    {
+      ushort checksum = (ushort)~Fold((uint)(ushort)~Word(bytes, offset) + delta);
+      bytes[offset] = (byte)(checksum >> 8);
+      bytes[offset + 1] = (byte)checksum;
+    }
+
+    private static ushort Word(byte[] bytes, int offset)
+    {
+      return (ushort)((bytes[offset] << 8) | bytes[offset + 1]);
+    }
+
+    // Adds the ones-complement difference made by replacing the 16-bit word "from" with "to".
+    private static uint AddReplacement(uint sum, ushort from, ushort to)
+    {
+      return sum + (ushort)~from + to;
+    }
+
+    private static ushort Fold(uint sum)
+    {
+      while ((sum >> 16) != 0)
+        sum = (sum & 0xFFFF) + (sum >> 16);
+      return (ushort)sum;
+    }
+  }
+}
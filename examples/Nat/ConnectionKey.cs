@@ -6,27 +6,34 @@ Use of this source code is governed by the Apache 2.0 license; see LICENSE.
 */
 
 using System;
-using System.Net;
-using PacketDotNet;
 
 namespace Pax.Examples.Nat
 {
   /// <summary>
   /// Lookup key for maps mapping Packets from the inside to the outside of a NAT or vice versa.
   /// </summary>
-  internal sealed class ConnectionKey : IEquatable<ConnectionKey>
+  /// <remarks>
+  /// This is a value type so that a key can be made for each packet without allocating.
+  /// </remarks>
+  internal struct ConnectionKey : IEquatable<ConnectionKey>
   {
     /// <summary>
     /// The source node.
     /// </summary>
-    public Node Source { get; }
+    public readonly NodeKey Source;
 
     /// <summary>
     /// The destination node.
     /// </summary>
-    public Node Destination { get; }
+    public readonly NodeKey Destination;
 
-    private readonly int hashCode;
+    /// <param name="source">The source node.</param>
+    /// <param name="destination">The destination node.</param>
+    public ConnectionKey(NodeKey source, NodeKey destination)
+    {
+      Source = source;
+      Destination = destination;
+    }
 
     /// <param name="source">The source node.</param>
     /// <param name="destination">The destination node.</param>
@@ -35,28 +42,25 @@ namespace Pax.Examples.Nat
       if (ReferenceEquals(null, source)) throw new ArgumentNullException(nameof(source));
       if (ReferenceEquals(null, destination)) throw new ArgumentNullException(nameof(destination));
 
-      Source = source;
-      Destination = destination;
-
-      hashCode = new { Source, Destination }.GetHashCode();
+      Source = source.Key;
+      Destination = destination.Key;
     }
 
     public override bool Equals(Object other)
     {
-      if (ReferenceEquals(null, other)) return false;
-      if (ReferenceEquals(this, other)) return true;
-      if (other.GetType() != GetType()) return false;
-      return this.Equals(other as ConnectionKey);
+      return other is ConnectionKey && Equals((ConnectionKey)other);
     }
 
     public bool Equals(ConnectionKey other)
     {
-      return !ReferenceEquals(null, other)
-        && Source.Equals(other.Source)
+      return Source.Equals(other.Source)
         && Destination.Equals(other.Destination);
     }
 
-    public override int GetHashCode() { return hashCode; }
+    public override int GetHashCode()
+    {
+      return Source.GetHashCode() * 31 + Destination.GetHashCode();
+    }
 
     public override string ToString()
     {
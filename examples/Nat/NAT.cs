@@ -30,28 +30,52 @@ resulting from the connection being closed eventually triggers the removal.
 UDP connections are treated in a similar manner, but any UDP packet from Inside can
 cause an entry to be added where there wasn't one before.
 
+The connection tables can be kept across restarts of Pax (e.g. to deploy a new
+build) by giving a snapshot file: the tables are written to it when Pax shuts
+down (and, optionally, periodically), and read back from it when the NAT starts,
+so established connections carry on being translated.
+
 NOTE could improve the implementation by having configurable "forwarding ports"
      that enable you to run servers on non-zero network ports.
 */
 
 using System;
+using System.IO;
+using System.IO.MemoryMappedFiles;
+using System.Linq;
 using System.Net;
 using System.Net.NetworkInformation;
 using System.Timers;
 using PacketDotNet;
+using SharpPcap;
 
 namespace Pax.Examples.Nat
 {
   /// <summary>
   /// A packet processor that performs Network Address Translation (a NAT).
   /// </summary>
-  public sealed class NAT : SimplePacketProcessor
+  public sealed class NAT : SimplePacketProcessor, IActive
   {
     /// A value indicating the packet should be dropped.
     public const int Port_Drop = -1;
 
+    private static readonly ForwardingDecision Drop = new ForwardingDecision.SinglePortForward(Port_Drop);
+
     private readonly Timer gcTimer;
 
+    // Identifies snapshot files, and the version of their format.
+    private static readonly byte[] SnapshotMagic = { (byte)'P', (byte)'A', (byte)'X', (byte)'N', (byte)'A', (byte)'T' };
+    private const byte SnapshotVersion = 1;
+
+    private readonly string snapshotFile;
+    private readonly Timer snapshotTimer;
+    private readonly object snapshotLock = new object();
+    private bool stopped = false;
+
+    // Each capture thread reuses its own encapsulation objects, rather than allocating them for every packet.
+    [ThreadStatic] private static TcpPacketEncapsulation tcp;
+    [ThreadStatic] private static UdpPacketEncapsulation udp;
+
     // Use a separate namespace for each transport protocol
     private TcpNAT tcpNat;
     private UdpNAT udpNat;
@@ -68,18 +92,39 @@ namespace Pax.Examples.Nat
     /// <param name="udp_inactivity_timeout">The time that should elapse before a UDP connection with no activity is removed.</param>
     /// <param name="udp_start_port">The start of the range of UDP ports to use (inclusive).</param>
     /// <param name="udp_end_port">The end of the range of UDP ports to use (inclusive).</param>
+    /// <param name="snapshot_file">Optional. A file to save the connection tables to when Pax stops, and to restore them from when the NAT starts.</param>
+    /// <param name="snapshot_interval">Optional. If given, the connection tables are also saved this often, in case Pax doesn't stop cleanly.</param>
     /// <remarks>
     /// The constructor parameters can be specified in the wiring configuration file, in the `args` dictionary of the handler entry.
     /// Every value must be specified as a string, and TimeSpans can be specified in the format `d | [d.]hh:mm[:ss[.ff]]`, e.g. 00:00:30 for 30 seconds.
     /// </remarks>
     public NAT (IPAddress my_address, PhysicalAddress next_outside_hop_mac,
       TimeSpan tcp_inactivity_timeout, TimeSpan tcp_time_wait_duration, ushort tcp_start_port, ushort tcp_end_port,
-      TimeSpan udp_inactivity_timeout, ushort udp_start_port, ushort udp_end_port)
+      TimeSpan udp_inactivity_timeout, ushort udp_start_port, ushort udp_end_port,
+      string snapshot_file = null, TimeSpan? snapshot_interval = null)
     {
       // Instantiate each NAT specialisation
       tcpNat = new TcpNAT(my_address, next_outside_hop_mac, tcp_inactivity_timeout, tcp_time_wait_duration, tcp_start_port, tcp_end_port);
       udpNat = new UdpNAT(my_address, next_outside_hop_mac, udp_inactivity_timeout, udp_start_port, udp_end_port);
 
+      // Carry on with the connections from the last run, if there are any
+      snapshotFile = snapshot_file;
+      if (snapshotFile != null)
+      {
+        LoadSnapshot();
+        // Save the tables once Pax has stopped every interface, rather than in Stop,
+        //  since other interfaces might still be adding connections when that's called.
+        Frontend.OnShutdown += WriteSnapshot;
+      }
+
+      if (snapshotFile != null && snapshot_interval.HasValue)
+      {
+        snapshotTimer = new Timer(snapshot_interval.Value.TotalMilliseconds);
+        snapshotTimer.Elapsed += (sender, e) => { if (!stopped) WriteSnapshot(); };
+        snapshotTimer.AutoReset = true;
+        snapshotTimer.Start();
+      }
+
       // Call the GarbageCollectConnections method regularly
       gcTimer = new Timer(1000); // FIXME should the GC frequency be configurable?
       gcTimer.Elapsed += GarbageCollectConnections;
@@ -103,7 +148,8 @@ namespace Pax.Examples.Nat
           Packet transportLayerPacket = packet.PayloadPacket.PayloadPacket;
           if (transportLayerPacket is TcpPacket)
           {
-            var tcp = new TcpPacketEncapsulation(packet);
+            if (tcp == null) tcp = new TcpPacketEncapsulation();
+            tcp.Wrap(packet);
 #if DEBUG
             Console.WriteLine("RX TCP {0}:{1} -> {2}:{3} on {4} [{5}{6}{7}{8}]",
               tcp.NetworkPacket.SourceAddress, tcp.TransportPacket.SourcePort, tcp.NetworkPacket.DestinationAddress, tcp.TransportPacket.DestinationPort, incomingNetworkInterface,
@@ -113,12 +159,13 @@ namespace Pax.Examples.Nat
           }
           else if (transportLayerPacket is UdpPacket)
           {
-            var udp = new UdpPacketEncapsulation(packet);
+            if (udp == null) udp = new UdpPacketEncapsulation();
+            udp.Wrap(packet);
 #if DEBUG
             Console.WriteLine("RX UDP {0}:{1} -> {2}:{3} on {4}",
               udp.NetworkPacket.SourceAddress, udp.TransportPacket.SourcePort, udp.NetworkPacket.DestinationAddress, udp.TransportPacket.DestinationPort, incomingNetworkInterface);
 #endif
-            return udpNat.handlePacket(new UdpPacketEncapsulation(packet), incomingNetworkInterface);
+            return udpNat.handlePacket(udp, incomingNetworkInterface);
           }
 #if DEBUG
           else
@@ -130,7 +177,7 @@ namespace Pax.Examples.Nat
       }
 
       // If we reach this point then we can't handle that type of packet
-      return new ForwardingDecision.SinglePortForward(Port_Drop);
+      return Drop;
     }
 
     /// <summary>
@@ -144,5 +191,96 @@ namespace Pax.Examples.Nat
       tcpNat.GarbageCollectConnections();
       udpNat.GarbageCollectConnections();
     }
+
+    public void PreStart(ICaptureDevice device) { }
+
+    public void Start() { }
+
+    /// <summary>
+    /// Called when Pax shuts down. Stops the timers; the connection tables are saved afterwards (see the constructor).
+    /// </summary>
+    public void Stop()
+    {
+      // This is called for each network interface that the NAT handles, but we only need to act once.
+      lock (snapshotLock)
+      {
+        if (stopped)
+          return;
+        stopped = true;
+      }
+
+      gcTimer.Stop();
+      snapshotTimer?.Stop();
+    }
+
+    /// <summary>
+    /// Saves the connection tables of each of the specialised NATs to the snapshot file.
+    /// </summary>
+    private void WriteSnapshot()
+    {
+      lock (snapshotLock)
+      {
+        try
+        {
+          // Write to a temporary file first, so that we can't leave a partly-written snapshot in place of a complete one.
+          string tempFile = snapshotFile + ".tmp";
+          using (var writer = new BinaryWriter(File.Create(tempFile)))
+          {
+            writer.Write(SnapshotMagic);
+            writer.Write(SnapshotVersion);
+            tcpNat.WriteSnapshot(writer);
+            udpNat.WriteSnapshot(writer);
+          }
+
+          if (File.Exists(snapshotFile))
+            File.Replace(tempFile, snapshotFile, null);
+          else
+            File.Move(tempFile, snapshotFile);
+        }
+        catch (Exception ex) when (ex is IOException || ex is UnauthorizedAccessException)
+        {
+          Console.WriteLine("Couldn't save the NAT snapshot to {0}: {1}", snapshotFile, ex.Message);
+        }
+      }
+    }
+
+    /// <summary>
+    /// Restores the connection tables of each of the specialised NATs from the snapshot file, if it exists.
+    /// If the snapshot can't be read, the NAT starts with empty tables.
+    /// </summary>
+    private void LoadSnapshot()
+    {
+      if (!File.Exists(snapshotFile) || new FileInfo(snapshotFile).Length == 0)
+        return;
+
+      try
+      {
+        // Map the file rather than reading it in, since it's read once from start to end.
+        using (var file = MemoryMappedFile.CreateFromFile(snapshotFile, FileMode.Open, null, 0, MemoryMappedFileAccess.Read))
+        using (var reader = new BinaryReader(file.CreateViewStream(0, 0, MemoryMappedFileAccess.Read)))
+        {
+          if (!reader.ReadBytes(SnapshotMagic.Length).SequenceEqual(SnapshotMagic))
+            throw new InvalidDataException("Not a NAT snapshot");
+          if (reader.ReadByte() != SnapshotVersion)
+            throw new InvalidDataException("Unsupported snapshot version");
+
+          // Read the whole snapshot before restoring any of it, so that a damaged snapshot isn't partly restored.
+          int tcpConnections, udpConnections;
+          Action restoreTcp = tcpNat.ReadSnapshot(reader, out tcpConnections);
+          Action restoreUdp = udpNat.ReadSnapshot(reader, out udpConnections);
+          restoreTcp();
+          restoreUdp();
+          if (!PaxConfig.opt_quiet)
+            Console.WriteLine("Restored {0} TCP and {1} UDP connections from {2}", tcpConnections, udpConnections, snapshotFile);
+        }
+      }
+      catch (Exception ex) when (ex is IOException
+                              || ex is InvalidDataException
+                              || ex is ArgumentException
+                              || ex is UnauthorizedAccessException)
+      {
+        Console.WriteLine("Couldn't restore the NAT snapshot from {0}: {1}", snapshotFile, ex.Message);
+      }
+    }
   }
 }
@@ -9,6 +9,7 @@ using PacketDotNet;
 using System;
 using System.Collections.Concurrent;
 using System.Collections.Generic;
+using System.IO;
 using System.Linq;
 using System.Net;
 using System.Net.NetworkInformation;
@@ -48,6 +49,12 @@ namespace Pax.Examples.Nat
     /// The MAC address of the next hop on the outside port.
     /// </summary>
     protected readonly PhysicalAddress NextOutsideHopMacAddress;
+    private readonly byte[] NextOutsideHopMacAddressBytes;
+
+    /// <summary>
+    /// A <see cref="ForwardingDecision.SinglePortForward"/> for each network interface, so that forwarding doesn't allocate.
+    /// </summary>
+    private readonly ForwardingDecision.SinglePortForward[] ForwardToPort;
 
     /// <summary>
     /// The time that an inactive connection entry must be kept before the entry can be removed.
@@ -68,7 +75,12 @@ namespace Pax.Examples.Nat
     {
       OutsideFacingAddress = outsideFacingAddress;
       NextOutsideHopMacAddress = nextOutsideHopMacAddress;
+      NextOutsideHopMacAddressBytes = nextOutsideHopMacAddress.GetAddressBytes();
       InactivityTimeout = inactivityTimeout;
+
+      ForwardToPort = new ForwardingDecision.SinglePortForward[PaxConfig_Lite.no_interfaces];
+      for (int port = 0; port < ForwardToPort.Length; port++)
+        ForwardToPort[port] = new ForwardingDecision.SinglePortForward(port);
     }
 
     /// <summary>
@@ -97,23 +109,18 @@ namespace Pax.Examples.Nat
     {
       // Retrieve the mapping. If a mapping doesn't exist, then it means that we're not
       // aware of a session to which the packet belongs: so drop the packet.
-      var key = new ConnectionKey(packet.GetSourceNode(), packet.GetDestinationNode());
+      var key = new ConnectionKey(packet.GetSourceKey(), packet.GetDestinationKey());
       NatConnection<TPacket,TNode> connection;
       if (NAT_MapToInside.TryGetValue(key, out connection))
       {
-        var destination = connection.InsideNode;
-
         // Update any connection state, including resetting the inactivity timer
         connection.ReceivedPacket(packet, packetFromInside: false);
 
-        // Rewrite the packet destination
-        packet.SetDestination(destination);
-
-        // Update checksums
-        packet.UpdateChecksums();
+        // Rewrite the packet destination, and update checksums
+        packet.RewriteDestination(connection.ToInsideRewrite);
 
         // Forward on the mapped network port
-        return new ForwardingDecision.SinglePortForward(destination.InterfaceNumber);
+        return ForwardToPort[connection.InsideNode.InterfaceNumber];
       }
       else
       {
@@ -127,11 +134,8 @@ namespace Pax.Examples.Nat
     /// <param name="packet">The outgoing packet.</param>
     private ForwardingDecision InsideToOutside(TEncapsulation packet, int incomingInterfaceNumber)
     {
-      // Get the mapping key, providing the interface numbers and mac in case we need to add a mapping
-      packet.LinkPacket.DestinationHwAddress = NextOutsideHopMacAddress; // Change MAC to reflect actual destination
-      TNode insideNode = packet.GetSourceNode(incomingInterfaceNumber),
-        outsideNode = packet.GetDestinationNode(Port_Outside);
-      var out_key = new ConnectionKey(insideNode, outsideNode);
+      packet.SetDestinationMacAddress(NextOutsideHopMacAddressBytes); // Change MAC to reflect actual destination
+      var out_key = new ConnectionKey(packet.GetSourceKey(), packet.GetDestinationKey());
 
       NatConnection<TPacket,TNode> connection;
       bool mappingExists = NAT_MapToOutside.TryGetValue(out_key, out connection);
@@ -140,7 +144,9 @@ namespace Pax.Examples.Nat
       {
         if (packet.SignalsStartOfConnection())
         {
-          // If new connection, then add a mapping
+          // If new connection, then add a mapping, providing the interface numbers and mac
+          TNode insideNode = packet.GetSourceNode(incomingInterfaceNumber),
+            outsideNode = packet.GetDestinationNode(Port_Outside);
           CreateMapping(incomingInterfaceNumber, insideNode, outsideNode, out connection);
         }
         else
@@ -153,14 +159,11 @@ namespace Pax.Examples.Nat
       // Update any connection state, including resetting the inactivity timer
       connection.ReceivedPacket(packet, packetFromInside: true);
 
-      // Rewrite the packet to appear to originate from the NAT
-      packet.SetSource(connection.NatNode);
-
-      // Update checksums
-      packet.UpdateChecksums();
+      // Rewrite the packet to appear to originate from the NAT, and update checksums
+      packet.RewriteSource(connection.ToOutsideRewrite);
 
       // Forward on the mapped network port
-      return new ForwardingDecision.SinglePortForward(connection.OutsideNode.InterfaceNumber);
+      return ForwardToPort[connection.OutsideNode.InterfaceNumber];
     }
 
     /// <summary>
@@ -199,7 +202,7 @@ namespace Pax.Examples.Nat
         {
           // Remove this connection from both lookups
           NAT_MapToInside.Remove(pair);
-          NAT_MapToOutside.Remove(new ConnectionKey(connection.InsideNode, connection.OutsideNode));
+          NAT_MapToOutside.Remove(connection.ToOutsideKey);
 #if DEBUG
           removedAny = true;
 #endif
@@ -220,6 +223,140 @@ namespace Pax.Examples.Nat
       // However, this would add complexity in terms of tracking which pool each connection should be in.
     }
 
+    /// <summary>
+    /// Writes the connection table, and any other state needed to carry on translating its connections, to a snapshot.
+    /// </summary>
+    /// <param name="writer">The writer for the snapshot.</param>
+    internal void WriteSnapshot(BinaryWriter writer)
+    {
+      WriteAllocatorState(writer);
+
+      // Each connection appears once in each lookup, so it's enough to write one of them.
+      var connections = NAT_MapToInside.Values.ToList();
+      writer.Write(connections.Count);
+      foreach (var connection in connections)
+      {
+        connection.InsideNode.Key.Write(writer);
+        writer.Write(connection.InsideNode.InterfaceNumber);
+        WriteMacAddress(writer, connection.InsideNode.MacAddress);
+        connection.OutsideNode.Key.Write(writer);
+        WriteMacAddress(writer, connection.OutsideNode.MacAddress);
+        connection.NatNode.Key.Write(writer);
+        writer.Write(connection.LastUsed.ToUniversalTime().Ticks);
+        WriteState(writer, connection.State);
+      }
+    }
+
+    /// <summary>
+    /// Reads a snapshot written by <see cref="WriteSnapshot(BinaryWriter)"/>, without changing the NAT's state.
+    /// Connections that don't fit the current configuration (e.g. if the NAT's address has changed) are skipped.
+    /// </summary>
+    /// <param name="reader">The reader for the snapshot.</param>
+    /// <param name="restored">The number of connections that will be restored.</param>
+    /// <returns>An action that adds the connections to the lookups and restores the allocator's state. Call it once the
+    /// rest of the snapshot has been read too, so that a damaged snapshot isn't partly restored.</returns>
+    internal Action ReadSnapshot(BinaryReader reader, out int restored)
+    {
+      Action restoreAllocator = ReadAllocatorState(reader);
+
+      int count = reader.ReadInt32();
+      if (count < 0) throw new InvalidDataException("Invalid number of connections " + count);
+
+      PhysicalAddress natMacAddress = PaxConfig.deviceMap[Port_Outside].MacAddress;
+      var connections = new List<NatConnection<TPacket,TNode>>();
+      for (int i = 0; i < count; i++)
+      {
+        NodeKey insideKey = NodeKey.Read(reader);
+        int insideInterfaceNumber = reader.ReadInt32();
+        PhysicalAddress insideMacAddress = ReadMacAddress(reader);
+        NodeKey outsideKey = NodeKey.Read(reader);
+        PhysicalAddress outsideMacAddress = ReadMacAddress(reader);
+        NodeKey natKey = NodeKey.Read(reader);
+        DateTime lastUsed = new DateTime(reader.ReadInt64(), DateTimeKind.Utc).ToLocalTime();
+        ITransportState<TPacket> state = ReadState(reader);
+
+        if (!natKey.GetAddress().Equals(OutsideFacingAddress) ||
+            insideInterfaceNumber == Port_Outside ||
+            insideInterfaceNumber < 0 || insideInterfaceNumber >= PaxConfig_Lite.no_interfaces)
+          continue;
+
+        connections.Add(new NatConnection<TPacket,TNode>(
+          RestoreNode(insideKey, insideInterfaceNumber, insideMacAddress),
+          RestoreNode(outsideKey, Port_Outside, outsideMacAddress),
+          RestoreNode(natKey, Port_Drop, natMacAddress),
+          state, lastUsed));
+      }
+
+      restored = connections.Count;
+      return () =>
+      {
+        restoreAllocator();
+        foreach (var connection in connections)
+        {
+          NAT_MapToOutside[connection.ToOutsideKey] = connection;
+          NAT_MapToInside[connection.ToInsideKey] = connection;
+        }
+
+#if DEBUG
+        Console.WriteLine("Restored {0} mappings", connections.Count);
+        PrintMappings();
+#endif
+      };
+    }
+
+    private static void WriteMacAddress(BinaryWriter writer, PhysicalAddress macAddress)
+    {
+      byte[] bytes = macAddress.GetAddressBytes();
+      writer.Write((byte)bytes.Length);
+      writer.Write(bytes);
+    }
+
+    private static PhysicalAddress ReadMacAddress(BinaryReader reader)
+    {
+      int length = reader.ReadByte();
+      byte[] bytes = reader.ReadBytes(length);
+      if (bytes.Length != length) throw new EndOfStreamException();
+      return new PhysicalAddress(bytes);
+    }
+
+    /// <summary>
+    /// Writes the state of the allocator used by <see cref="CreateMasqueradeNode"/> to a snapshot, so that after a restart it
+    /// carries on from where it was (e.g. rather than handing out the ports of restored connections again).
+    /// </summary>
+    protected virtual void WriteAllocatorState(BinaryWriter writer) { }
+
+    /// <summary>
+    /// Reads the state written by <see cref="WriteAllocatorState(BinaryWriter)"/>.
+    /// </summary>
+    /// <returns>An action that restores the allocator to the state that was read.</returns>
+    protected virtual Action ReadAllocatorState(BinaryReader reader)
+    {
+      return () => { };
+    }
+
+    /// <summary>
+    /// Writes a connection's transport-layer state to a snapshot. By default nothing is written, which suits stateless
+    /// protocols such as UDP.
+    /// </summary>
+    protected virtual void WriteState(BinaryWriter writer, ITransportState<TPacket> state) { }
+
+    /// <summary>
+    /// Reads a connection's transport-layer state written by <see cref="WriteState(BinaryWriter, ITransportState{TPacket})"/>.
+    /// By default this returns the initial state for a new connection.
+    /// </summary>
+    protected virtual ITransportState<TPacket> ReadState(BinaryReader reader)
+    {
+      return GetInitialStateForNewConnection();
+    }
+
+    /// <summary>
+    /// Creates a <see cref="TNode"/> with the given addressing information, when restoring a connection from a snapshot.
+    /// </summary>
+    /// <param name="key">The node's key, as written to the snapshot.</param>
+    /// <param name="interfaceNumber">The interface number to use.</param>
+    /// <param name="macAddress">The MAC address to use.</param>
+    protected abstract TNode RestoreNode(NodeKey key, int interfaceNumber, PhysicalAddress macAddress);
+
     /// <summary>
     /// Creates a new <see cref="TNode"/> that can act as the masquerading address for a new connection. E.g. an unused TCP socket on the NAT host.
     /// Note that as all the information required to instantiate a <see cref="Node"/> is provided, in practice the main purpose of this method
@@ -251,12 +388,10 @@ namespace Pax.Examples.Nat
       connection = new NatConnection<TPacket,TNode>(insideNode, outsideNode, natNode, GetInitialStateForNewConnection());
 
       // Add to NAT_MapToOutside
-      var toOutsideKey = new ConnectionKey(insideNode, outsideNode);
-      NAT_MapToOutside[toOutsideKey] = connection;
+      NAT_MapToOutside[connection.ToOutsideKey] = connection;
 
       // Add to NAT_MapToInside
-      var toInsideKey = new ConnectionKey(outsideNode, natNode);
-      NAT_MapToInside[toInsideKey] = connection;
+      NAT_MapToInside[connection.ToInsideKey] = connection;
 
 #if DEBUG
       Console.WriteLine("Added mapping");
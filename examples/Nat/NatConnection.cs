@@ -37,6 +37,26 @@ namespace Pax.Examples.Nat
     /// </summary>
     public ITransportState<TPacket> State { get; }
 
+    /// <summary>
+    /// The key that packets from the inside node to the outside node are looked up by.
+    /// </summary>
+    public ConnectionKey ToOutsideKey { get; }
+
+    /// <summary>
+    /// The key that packets from the outside node to the NAT node are looked up by.
+    /// </summary>
+    public ConnectionKey ToInsideKey { get; }
+
+    /// <summary>
+    /// Rewrites the source of packets from the inside node, so that they appear to come from the NAT node.
+    /// </summary>
+    public AddressRewrite ToOutsideRewrite { get; }
+
+    /// <summary>
+    /// Rewrites the destination of packets from the outside node, so that they go to the inside node.
+    /// </summary>
+    public AddressRewrite ToInsideRewrite { get; }
+
     /// <summary>
     /// The last time that a packet for this connection was observed.
     /// </summary>
@@ -44,6 +64,12 @@ namespace Pax.Examples.Nat
     private readonly object LastUsed_Lock = new object();
 
     public NatConnection(TNode insideNode, TNode outsideNode, TNode natNode, ITransportState<TPacket> initialState)
+      : this(insideNode, outsideNode, natNode, initialState, DateTime.Now) { }
+
+    /// <summary>
+    /// Creates a connection that was last used at the given time, e.g. one restored from a snapshot.
+    /// </summary>
+    public NatConnection(TNode insideNode, TNode outsideNode, TNode natNode, ITransportState<TPacket> initialState, DateTime lastUsed)
     {
       if (Object.ReferenceEquals(null, insideNode)) throw new ArgumentNullException(nameof(insideNode));
       if (Object.ReferenceEquals(null, outsideNode)) throw new ArgumentNullException(nameof(outsideNode));
@@ -54,7 +80,13 @@ namespace Pax.Examples.Nat
       OutsideNode = outsideNode;
       NatNode = natNode;
       State = initialState;
-      LastUsed = DateTime.Now;
+      LastUsed = lastUsed;
+
+      // Prepare everything needed to translate the connection's packets, so that doing so doesn't allocate.
+      ToOutsideKey = new ConnectionKey(insideNode, outsideNode);
+      ToInsideKey = new ConnectionKey(outsideNode, natNode);
+      ToOutsideRewrite = new AddressRewrite(insideNode, natNode);
+      ToInsideRewrite = new AddressRewrite(natNode, insideNode);
     }
 
     /// <summary>
@@ -37,6 +37,11 @@ namespace Pax.Examples.Nat
     /// </summary>
     public PhysicalAddress MacAddress { get; }
 
+    /// <summary>
+    /// Gets the addressing information that identifies the node, for use in lookups.
+    /// </summary>
+    public NodeKey Key { get; protected set; }
+
     private readonly int hashCode;
 
     /// <summary>
@@ -53,6 +58,7 @@ namespace Pax.Examples.Nat
       Address = address;
       InterfaceNumber = interfaceNumber;
       MacAddress = macAddress;
+      Key = NodeKey.FromAddress(address, 0);
 
       // Pre-compute the hash code
       hashCode = new { Address }.GetHashCode(); // FIXME test to see if the hash code of this object is used
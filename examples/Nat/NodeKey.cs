@@ -0,0 +1,132 @@
+/*
+Pax : tool support for prototyping packet processors
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+*/
+
+using System;
+using System.IO;
+using System.Net;
+
+namespace Pax.Examples.Nat
+{
+  /// <summary>
+  /// The addressing information that identifies a <see cref="Node"/>: its IP address and, if it has one, its port.
+  /// </summary>
+  /// <remarks>
+  /// This is a value type, and can be read directly from a packet's bytes, so that looking up connections
+  /// for each packet doesn't allocate.
+  /// </remarks>
+  public struct NodeKey : IEquatable<NodeKey>
+  {
+    // The address is held as two 64-bit halves. IPv4 addresses only use the lower half.
+    private readonly ulong AddressHigh;
+    private readonly ulong AddressLow;
+
+    /// <summary>
+    /// The length of the address in bytes: 4 for IPv4, and 16 for IPv6.
+    /// </summary>
+    public readonly byte AddressLength;
+
+    /// <summary>
+    /// The port number, or 0 if the node doesn't have one.
+    /// </summary>
+    public readonly ushort Port;
+
+    /// <param name="bytes">An array containing the IP address in network byte order.</param>
+    /// <param name="offset">The offset of the address in <paramref name="bytes"/>.</param>
+    /// <param name="length">The length of the address in bytes.</param>
+    /// <param name="port">The port number, or 0 if the node doesn't have one.</param>
+    public NodeKey(byte[] bytes, int offset, int length, ushort port)
+    {
+      if (length != 4 && length != 16) throw new ArgumentOutOfRangeException(nameof(length));
+
+      ulong high = 0, low = 0;
+      for (int i = 0; i < length; i++)
+      {
+        if (i < length - 8)
+          high = (high << 8) | bytes[offset + i];
+        else
+          low = (low << 8) | bytes[offset + i];
+      }
+
+      AddressHigh = high;
+      AddressLow = low;
+      AddressLength = (byte)length;
+      Port = port;
+    }
+
+    /// <summary>
+    /// Creates the key for an address and port.
+    /// </summary>
+    public static NodeKey FromAddress(IPAddress address, ushort port)
+    {
+      byte[] bytes = address.GetAddressBytes();
+      return new NodeKey(bytes, 0, bytes.Length, port);
+    }
+
+    /// <summary>
+    /// Gets the IP address.
+    /// </summary>
+    public IPAddress GetAddress()
+    {
+      return new IPAddress(GetAddressBytes());
+    }
+
+    private byte[] GetAddressBytes()
+    {
+      byte[] bytes = new byte[AddressLength];
+      for (int i = AddressLength - 1; i >= 0; i--)
+      {
+        int shift = 8 * ((AddressLength - 1 - i) % 8);
+        bytes[i] = (byte)((i < AddressLength - 8 ? AddressHigh : AddressLow) >> shift);
+      }
+      return bytes;
+    }
+
+    /// <summary>
+    /// Writes the key in the form read by <see cref="Read(BinaryReader)"/>.
+    /// </summary>
+    internal void Write(BinaryWriter writer)
+    {
+      writer.Write(AddressLength);
+      writer.Write(GetAddressBytes());
+      writer.Write(Port);
+    }
+
+    /// <summary>
+    /// Reads a key written by <see cref="Write(BinaryWriter)"/>.
+    /// </summary>
+    internal static NodeKey Read(BinaryReader reader)
+    {
+      int length = reader.ReadByte();
+      if (length != 4 && length != 16) throw new InvalidDataException("Invalid address length " + length);
+      byte[] bytes = reader.ReadBytes(length);
+      if (bytes.Length != length) throw new EndOfStreamException();
+      return new NodeKey(bytes, 0, length, reader.ReadUInt16());
+    }
+
+    public override bool Equals(Object other)
+    {
+      return other is NodeKey && Equals((NodeKey)other);
+    }
+
+    public bool Equals(NodeKey other)
+    {
+      return AddressLow == other.AddressLow
+        && AddressHigh == other.AddressHigh
+        && Port == other.Port
+        && AddressLength == other.AddressLength;
+    }
+
+    public override int GetHashCode()
+    {
+      return (AddressLow.GetHashCode() * 31 + AddressHigh.GetHashCode()) * 31 + Port;
+    }
+
+    public override string ToString()
+    {
+      return String.Format("{0}:{1}", GetAddress(), Port);
+    }
+  }
+}
@@ -35,6 +35,7 @@ namespace Pax.Examples.Nat
       : base(address, interfaceNumber, macAddress)
     {
       Port = port;
+      Key = NodeKey.FromAddress(address, port);
     }
 
     public override bool Equals(Object other)
@@ -7,6 +7,7 @@ Use of this source code is governed by the Apache 2.0 license; see LICENSE.
 
 using System;
 using PacketDotNet;
+using PacketDotNet.Utils;
 
 namespace Pax.Examples.Nat
 {
@@ -20,27 +21,73 @@ namespace Pax.Examples.Nat
     /// <summary>
     /// The link-layer packet.
     /// </summary>
-    public EthernetPacket LinkPacket { get; }
+    public EthernetPacket LinkPacket { get; private set; }
 
     /// <summary>
     /// The network-layer packet.
     /// </summary>
-    public IpPacket NetworkPacket { get; }
+    public IpPacket NetworkPacket { get; private set; }
 
     /// <summary>
     /// The transport-layer packet.
     /// </summary>
-    public TTransport TransportPacket { get; }
+    public TTransport TransportPacket { get; private set; }
+
+    // The bytes that the packets above were parsed from, and where each layer's header starts.
+    // These are used to read and rewrite addresses without going through PacketDotNet, which
+    // allocates new objects for each address it's given or returns.
+    private byte[] Frame;
+    private int LinkOffset;
+    private int NetworkOffset;
+    private int TransportOffset;
+    private bool IsIPv4;
+
+    // Positions of fields within the headers.
+    private const int EthernetHeaderLength = 14;
+    private const int EthernetDestinationPosition = 0;
+    private const int EthernetSourcePosition = 6;
+    private const int IPv4ChecksumPosition = 10;
+    private const int IPv4SourcePosition = 12;
+    private const int IPv4DestinationPosition = 16;
+    private const int IPv6HeaderLength = 40;
+    private const int IPv6SourcePosition = 8;
+    private const int IPv6DestinationPosition = 24;
+    private const int SourcePortPosition = 0;
+    private const int DestinationPortPosition = 2;
+
+    /// <summary>
+    /// Creates an encapsulation that doesn't wrap a packet yet. Call <see cref="Wrap(Packet)"/> before using it.
+    /// </summary>
+    protected PacketEncapsulation() { }
 
     /// <summary>
     /// Casts the packet and it's payload packets to the correct types.
     /// </summary>
     /// <param name="packet"></param>
     public PacketEncapsulation(Packet packet)
+    {
+      Wrap(packet);
+    }
+
+    /// <summary>
+    /// Casts the packet and it's payload packets to the correct types, replacing any packet
+    /// wrapped previously. This allows an encapsulation to be reused for each packet.
+    /// </summary>
+    /// <param name="packet"></param>
+    public void Wrap(Packet packet)
     {
       LinkPacket = (EthernetPacket)packet;
       NetworkPacket = (IpPacket)LinkPacket.PayloadPacket;
       TransportPacket = (TTransport)NetworkPacket.PayloadPacket;
+
+      // NOTE this allocates a ByteArraySegment for each packet: PacketDotNet doesn't
+      //      expose the buffer that a packet was parsed from in any other way.
+      ByteArraySegment bytes = LinkPacket.BytesHighPerformance;
+      Frame = bytes.Bytes;
+      LinkOffset = bytes.Offset;
+      NetworkOffset = LinkOffset + EthernetHeaderLength;
+      IsIPv4 = NetworkPacket is IPv4Packet;
+      TransportOffset = NetworkOffset + (IsIPv4 ? (Frame[NetworkOffset] & 0x0F) * 4 : IPv6HeaderLength);
     }
 
     /// <summary>
@@ -88,6 +135,110 @@ namespace Pax.Examples.Nat
       OnSetDestination(node);
     }
 
+    /// <summary>
+    /// Rewrites the packet's source, using values that were prepared in advance.
+    /// Unlike <see cref="SetSource(TNode)"/>, this updates the checksums too, and doesn't allocate.
+    /// </summary>
+    internal void RewriteSource(AddressRewrite rewrite)
+    {
+      Rewrite(rewrite, EthernetSourcePosition, IsIPv4 ? IPv4SourcePosition : IPv6SourcePosition, SourcePortPosition);
+    }
+
+    /// <summary>
+    /// Rewrites the packet's destination, using values that were prepared in advance.
+    /// Unlike <see cref="SetDestination(TNode)"/>, this updates the checksums too, and doesn't allocate.
+    /// </summary>
+    internal void RewriteDestination(AddressRewrite rewrite)
+    {
+      Rewrite(rewrite, EthernetDestinationPosition, IsIPv4 ? IPv4DestinationPosition : IPv6DestinationPosition, DestinationPortPosition);
+    }
+
+    private void Rewrite(AddressRewrite rewrite, int macPosition, int addressPosition, int portPosition)
+    {
+      // Rewrite the MAC address
+      Buffer.BlockCopy(rewrite.MacAddress, 0, Frame, LinkOffset + macPosition, rewrite.MacAddress.Length);
+
+      // Rewrite the IP address
+      Buffer.BlockCopy(rewrite.Address, 0, Frame, NetworkOffset + addressPosition, rewrite.Address.Length);
+
+      // Rewrite the port
+      if (rewrite.RewritesPort)
+        WriteTransportWord(portPosition, rewrite.Port);
+
+      // Update checksums (IPv6 doesn't have a header checksum)
+      if (IsIPv4)
+        AddressRewrite.AdjustChecksum(Frame, NetworkOffset + IPv4ChecksumPosition, rewrite.NetworkChecksumDelta);
+      AdjustTransportChecksum(rewrite.TransportChecksumDelta);
+    }
+
+    /// <summary>
+    /// Sets the packet's destination MAC address.
+    /// </summary>
+    /// <param name="macAddress">The 6 bytes of the MAC address.</param>
+    public void SetDestinationMacAddress(byte[] macAddress)
+    {
+      Buffer.BlockCopy(macAddress, 0, Frame, LinkOffset + EthernetDestinationPosition, macAddress.Length);
+    }
+
+    /// <summary>
+    /// Gets the key of the source node of this packet, without allocating.
+    /// </summary>
+    public NodeKey GetSourceKey()
+    {
+      return GetKey(IsIPv4 ? IPv4SourcePosition : IPv6SourcePosition, SourcePortPosition);
+    }
+
+    /// <summary>
+    /// Gets the key of the destination node of this packet, without allocating.
+    /// </summary>
+    public NodeKey GetDestinationKey()
+    {
+      return GetKey(IsIPv4 ? IPv4DestinationPosition : IPv6DestinationPosition, DestinationPortPosition);
+    }
+
+    private NodeKey GetKey(int addressPosition, int portPosition)
+    {
+      ushort port = HasPorts ? ReadTransportWord(portPosition) : (ushort)0;
+      return new NodeKey(Frame, NetworkOffset + addressPosition, IsIPv4 ? 4 : 16, port);
+    }
+
+    /// <summary>
+    /// Reads the 16-bit value at the given position in the transport-layer header.
+    /// </summary>
+    protected ushort ReadTransportWord(int position)
+    {
+      return (ushort)((Frame[TransportOffset + position] << 8) | Frame[TransportOffset + position + 1]);
+    }
+
+    /// <summary>
+    /// Adds <paramref name="delta"/> to the checksum at the given position in the transport-layer header.
+    /// </summary>
+    protected void AdjustTransportChecksumAt(int position, ushort delta)
+    {
+      AddressRewrite.AdjustChecksum(Frame, TransportOffset + position, delta);
+    }
+
+    /// <summary>
+    /// Writes a 16-bit value at the given position in the transport-layer header.
+    /// </summary>
+    protected void WriteTransportWord(int position, ushort value)
+    {
+      Frame[TransportOffset + position] = (byte)(value >> 8);
+      Frame[TransportOffset + position + 1] = (byte)value;
+    }
+
+    /// <summary>
+    /// Gets a value indicating if the transport-layer header starts with source and destination ports,
+    /// which are then part of the keys returned by <see cref="GetSourceKey"/> and <see cref="GetDestinationKey"/>.
+    /// </summary>
+    protected abstract bool HasPorts { get; }
+
+    /// <summary>
+    /// Adds <paramref name="delta"/> to the checksum of the transport-layer packet. This is called after the
+    /// packet's addresses are rewritten by <see cref="RewriteSource"/> or <see cref="RewriteDestination"/>.
+    /// </summary>
+    protected abstract void AdjustTransportChecksum(ushort delta);
+
     /// <summary>
     /// Gets the source node of this packet (where it appears to originate from).
     /// </summary>
@@ -135,8 +286,14 @@ namespace Pax.Examples.Nat
   /// </summary>
   public sealed class TcpPacketEncapsulation : PacketEncapsulation<TcpPacket,NodeWithPort>
   {
+    // Position of the checksum in the TCP header.
+    private const int ChecksumPosition = 16;
+
+    public TcpPacketEncapsulation() { }
     public TcpPacketEncapsulation(Packet packet) : base(packet) { }
 
+    protected override bool HasPorts { get { return true; } }
+
     public override NodeWithPort GetSourceNode(int incomingNetworkInterface = -1)
     {
       return new NodeWithPort(NetworkPacket.SourceAddress, TransportPacket.SourcePort, incomingNetworkInterface, LinkPacket.SourceHwAddress);
@@ -165,6 +322,11 @@ namespace Pax.Examples.Nat
       TransportPacket.UpdateTCPChecksum();
     }
 
+    protected override void AdjustTransportChecksum(ushort delta)
+    {
+      AdjustTransportChecksumAt(ChecksumPosition, delta);
+    }
+
     public override bool SignalsStartOfConnection()
     {
       return TransportPacket.Syn; // Only Syn packets start connections
@@ -176,8 +338,14 @@ namespace Pax.Examples.Nat
   /// </summary>
   public sealed class UdpPacketEncapsulation : PacketEncapsulation<UdpPacket,NodeWithPort>
   {
+    // Position of the checksum in the UDP header.
+    private const int ChecksumPosition = 6;
+
+    public UdpPacketEncapsulation() { }
     public UdpPacketEncapsulation(Packet packet) : base(packet) { }
 
+    protected override bool HasPorts { get { return true; } }
+
     public override NodeWithPort GetSourceNode(int incomingNetworkInterface = -1)
     {
       return new NodeWithPort(NetworkPacket.SourceAddress, TransportPacket.SourcePort, incomingNetworkInterface, LinkPacket.SourceHwAddress);
@@ -205,6 +373,19 @@ namespace Pax.Examples.Nat
       TransportPacket.UpdateUDPChecksum();
     }
 
+    protected override void AdjustTransportChecksum(ushort delta)
+    {
+      // A checksum of 0 means that the sender didn't compute one, so leave it that way.
+      if (ReadTransportWord(ChecksumPosition) == 0)
+        return;
+
+      AdjustTransportChecksumAt(ChecksumPosition, delta);
+
+      // A computed checksum of 0 is sent as all ones (RFC 768).
+      if (ReadTransportWord(ChecksumPosition) == 0)
+        WriteTransportWord(ChecksumPosition, 0xFFFF);
+    }
+
     public override bool SignalsStartOfConnection()
     {
       // Any UDP packet could be the start of a 'connection'
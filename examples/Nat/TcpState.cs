@@ -6,6 +6,7 @@ Use of this source code is governed by the Apache 2.0 license; see LICENSE.
 */
 
 using System;
+using System.IO;
 using PacketDotNet;
 
 namespace Pax.Examples.Nat
@@ -119,10 +120,43 @@ namespace Pax.Examples.Nat
       }
     }
 
+    /// <summary>
+    /// Writes the state to a snapshot, in the form read by <see cref="Read(BinaryReader, TimeSpan)"/>.
+    /// </summary>
+    internal void Write(BinaryWriter writer)
+    {
+      writer.Write((byte)InOutConnection);
+      writer.Write((byte)OutInConnection);
+      writer.Write(CloseTime.HasValue ? CloseTime.Value.ToUniversalTime().Ticks : 0L);
+    }
+
+    /// <summary>
+    /// Reads a state written by <see cref="Write(BinaryWriter)"/>.
+    /// </summary>
+    /// <param name="time_wait">The duration of the TIME_WAIT state.</param>
+    internal static TcpState Read(BinaryReader reader, TimeSpan time_wait)
+    {
+      var state = new TcpState(time_wait);
+      state.InOutConnection = ReadDirectionalState(reader);
+      state.OutInConnection = ReadDirectionalState(reader);
+      long closeTicks = reader.ReadInt64();
+      if (closeTicks != 0)
+        state.CloseTime = new DateTime(closeTicks, DateTimeKind.Utc).ToLocalTime();
+      return state;
+    }
+
+    private static TcpDirectionalState ReadDirectionalState(BinaryReader reader)
+    {
+      var state = (TcpDirectionalState)reader.ReadByte();
+      if (!Enum.IsDefined(typeof(TcpDirectionalState), state))
+        throw new InvalidDataException("Invalid TCP state " + state);
+      return state;
+    }
+
     /// <summary>
     /// Possible connection states from the point of view of the NAT.
     /// </summary>
-    private enum TcpDirectionalState
+    private enum TcpDirectionalState : byte
     {
       /// <summary> This connection has no state. </summary>
       None,
@@ -8,6 +8,7 @@ Use of this source code is governed by the Apache 2.0 license; see LICENSE.
 using PacketDotNet;
 using System;
 using System.Collections.Generic;
+using System.IO;
 using System.Linq;
 using System.Net.NetworkInformation;
 using System.Text;
@@ -73,6 +74,33 @@ namespace Pax.Examples.Nat
       return new NodeWithPort(ipAddress, port, interfaceNumber, macAddress);
     }
 
+    protected override NodeWithPort RestoreNode(NodeKey key, int interfaceNumber, PhysicalAddress macAddress)
+    {
+      return new NodeWithPort(key.GetAddress(), key.Port, interfaceNumber, macAddress);
+    }
+
+    protected override void WriteAllocatorState(BinaryWriter writer)
+    {
+      lock (nextPortLock)
+      {
+        writer.Write(nextPort);
+      }
+    }
+
+    protected override Action ReadAllocatorState(BinaryReader reader)
+    {
+      ushort port = reader.ReadUInt16();
+      return () =>
+      {
+        lock (nextPortLock)
+        {
+          // Ignore the saved port if the range has since been changed to exclude it
+          if (port >= StartPort && port <= EndPort)
+            nextPort = port;
+        }
+      };
+    }
+
     protected override ITransportState<UdpPacket> GetInitialStateForNewConnection()
     {
       return NoTransportState<UdpPacket>.Instance;
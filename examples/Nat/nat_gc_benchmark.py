@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding: latin-1
+
+"""
+nat_gc_benchmark.py: measures the garbage collection and the tail latency of the
+NAT at a fixed offered load.
+
+A UDP flow is sent at a fixed rate from in1, through the NAT, to an echo server
+on out0, and the round-trip time of each datagram is measured. The sender
+doesn't wait for replies (so a slow packet doesn't slow down the ones after it),
+which means that pauses in the NAT, such as those caused by garbage collection,
+show up in the tail of the latency distribution. Pax is run with -v, so that it
+reports how many garbage collections it did when it stops; it's stopped with
+SIGTERM, which it handles whether or not it's attached to a terminal.
+
+Several builds of the examples can be compared, e.g. before and after a change:
+  $ sudo -E ./examples/Nat/nat_gc_benchmark.py --code before=/tmp/Examples-before.dll --code after=examples/Bin/Examples.dll
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+"""
+
+from mininet.log import setLogLevel
+import argparse
+import os
+import re
+import signal
+import sys
+import time
+
+PAX = None
+try:
+    PAX = os.environ['PAX']
+except KeyError:
+    print "PAX environment variable must point to path where Pax repo is cloned"
+    exit(1)
+
+sys.path.insert(0, PAX + "/mininet/")
+sys.path.insert(0, PAX + "/examples/Nat/")
+from pax_mininet_cmd import start, wait
+from pax_mininet_traffic import parse_result, helper_cmd, pax_startup_wait
+
+udp_port = 12031
+
+def gc_counts(pax_output):
+    "Parses the garbage collection counts that Pax prints when it stops."
+    match = re.search(r"GC collections: gen0=(\d+) gen1=(\d+) gen2=(\d+)", pax_output)
+    if match is None:
+        return None
+    return tuple(int(n) for n in match.groups())
+
+def measure(net, code, config):
+    "Runs the NAT from the given build under load, and returns the load generator's results with Pax's GC counts added."
+    from nat_topo import wiring
+    nat0, out0, in1 = net.get("nat0"), net.get("out0"), net.get("in1")
+
+    cmd = "%s/Bin/Pax.exe --config=%s --code=%s -v" % (PAX, wiring(2), code)
+    print "  %s> $ %s" % (nat0.name, cmd)
+    pax = start(nat0, cmd)
+    try:
+        time.sleep(pax_startup_wait)
+        server = start(out0, helper_cmd("udp_echo_server", udp_port, config.duration + config.timeout + 2))
+        time.sleep(1)
+        load = start(in1, helper_cmd("udp_load", out0.IP(), udp_port, config.rate, config.duration,
+                                     config.size, config.timeout))
+        wait([load])
+        result = parse_result(load.output)
+    finally:
+        pax.signal(signal.SIGTERM)
+        wait([pax])
+
+    result["gc"] = gc_counts(pax.output)
+    if result["gc"] is None:
+        raise Exception("Pax didn't report its garbage collections when it stopped:\n" + pax.output)
+    return result
+
+def benchmark(config):
+    from nat_topo import createNetwork
+    net = createNetwork(2)
+    results = []
+    try:
+        for (label, code) in config.code:
+            print "Running %s (%s)" % (label, code)
+            for run in range(config.repeat):
+                results.append((label, measure(net, code, config)))
+    finally:
+        net.stop()
+
+    print ""
+    print "Offered load: %d datagrams/s of %d bytes for %ds" % (config.rate, config.size, config.duration)
+    print "%-12s %8s %10s %10s %10s   %s" % ("build", "lost", "p50 us", "p99 us", "p99.9 us", "GCs (gen0/gen1/gen2)")
+    for (label, result) in results:
+        print "%-12s %8s %10s %10s %10s   %s" % (label, result["lost"],
+            as_us(result["p50_us"]), as_us(result["p99_us"]), as_us(result["p999_us"]),
+            "%d/%d/%d" % result["gc"])
+    print "(GC counts cover Pax's whole run, including start-up.)"
+
+def as_us(v):
+    return "-" if v in [None, "None"] else "%.0f" % float(v)
+
+def code_arg(s):
+    "Parses a --code argument, of the form label=path."
+    if "=" not in s:
+        return (os.path.basename(s), os.path.abspath(s))
+    (label, path) = s.split("=", 1)
+    return (label, os.path.abspath(path))
+
+# This code runs when the script is executed (e.g. $ sudo -E ${PAX}/examples/Nat/nat_gc_benchmark.py)
+if __name__ == '__main__':
+    setLogLevel('warning')
+
+    parser = argparse.ArgumentParser(description="Measure the NAT's garbage collection and tail latency at a fixed load.")
+    parser.add_argument("--code", type=code_arg, action="append",
+                        help="label=path of a build of the examples to measure; can be repeated to compare builds")
+    parser.add_argument("--rate", type=int, default=5000, help="datagrams sent per second")
+    parser.add_argument("--size", type=int, default=64, help="size in bytes of the UDP payloads sent")
+    parser.add_argument("--duration", type=int, default=20, help="seconds of load for each measurement")
+    parser.add_argument("--timeout", type=float, default=1.0, help="seconds to wait for the last replies")
+    parser.add_argument("--repeat", type=int, default=1, help="number of runs for each build")
+
+    config = parser.parse_args()
+    if config.code is None:
+        config.code = [("current", PAX + "/examples/Bin/Examples.dll")]
+    benchmark(config)
@@ -12,10 +12,11 @@ from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.cli import CLI
 from mininet.log import setLogLevel
+import json
 import random
+import signal
 import time
 import thread
-import threading
 import os
 
 # Add Pax's mininet/ directory to path so we can use the PaxNode class
@@ -28,6 +29,8 @@ except KeyError:
 import sys
 sys.path.insert(0, PAX + "/mininet/")
 from pax_mininet_node import PaxNode
+from pax_mininet_cmd import start, wait, run as run_cmd, fan_out
+from pax_mininet_traffic import parse_result, helper_cmd, pax_startup_wait
 
 config = None
 
@@ -99,44 +102,41 @@ def run(n=2):
     net.stop()
 
 # Start the network, run an automated test, and shut down the network.
-def test():
+def test(n=2):
     "Test the NAT implementation"
     # Create the network and initialise for testing:
-    net = createNetwork(n=2)
+    net = createNetwork(n)
 
     # Provide CLI access if requested
     if config.cli_first:
         CLI(net)
 
-    # Names of the hosts we are interested in
-    nat0 = "nat0"
-    out0 = "out0"
-    in1 = "in1"
-    in2 = "in2"
+    # The hosts we are interested in
+    nat0 = net.get("nat0")
+    out0 = net.get("out0")
+    inside = [net.get("in%d" % i) for i in range(1, n+1)]
+    in1 = inside[0]
 
     # Start the Pax NAT process on the NAT node:
     # Start it in a separate terminal so that we can see the output in real time.
-    print "Starting Pax NAT process on %s:" % nat0
-    cmd = PAX + '/Bin/Pax.exe --config=' + PAX + '/examples/Nat/nat_wiring_test.json --code=' + PAX + '/examples/Bin/Examples.dll'
+    print "Starting Pax NAT process on %s:" % nat0.name
+    cmd = PAX + '/Bin/Pax.exe --config=' + wiring(n) + ' --code=' + PAX + '/examples/Bin/Examples.dll'
     if config.X_windows:
-        cmd = 'x-terminal-emulator -e \'%s\' &' % (cmd)
-        runCmd(net, nat0, cmd)
-    else:
-        sendCmd(net, nat0, cmd)
+        cmd = 'x-terminal-emulator -e \'%s\'' % (cmd)
+    pax = start(nat0, cmd)
 
     # Test the NAT by opening a connection between in1 and out0:
-    print "Connecting from %s to %s:" % (in1, out0)
+    print "Connecting from %s to %s:" % (in1.name, out0.name)
     # Set up a simple netcat server on out0 to respond with data when in1 connects:
     data = "Hello, are you there?"
-    runCmd(net, out0, 'echo %s | netcat -l 12001 &' % data)
+    server = start(out0, 'echo %s | netcat -l 12001' % data)
+    time.sleep(1)
     # Connect to out0 from in1 and get the data received:
     # Timeout after 10 seconds if nothing happens
-    result = runCmd(net, in1, 'netcat -n %s 12001' % ip(net, out0), timeout=10.0)
-    # Trim newline chars from output
-    if result is not None:
-        result = result.rstrip('\n\r')
+    result = output(run_cmd(in1, 'netcat -n %s 12001' % out0.IP(), timeout=10.0))
+    server.signal(signal.SIGTERM)
     # Print what was received
-    received(in1, result)
+    received(in1.name, result)
     # Check that the received data was correct:
     if (result != data):
         print "WARNING: incorrect data received"
@@ -145,22 +145,20 @@ def test():
 
     # Test UDP support
     print ""
-    print "Sending data via UDP from %s to %s:" % (in1, out0)
+    print "Sending data via UDP from %s to %s:" % (in1.name, out0.name)
     # Set up a simple netcat server on out0 to get the data that in1 sends and respond:
     server_data = "Yes, UDP"
-    sendCmd(net, out0, 'echo %s | nc -u -l 12001 -q1' % server_data) # q1 makes nc quit 1s after it sends the response
+    server = start(out0, 'echo %s | nc -u -l 12001 -q1' % server_data, timeout=10.0) # q1 makes nc quit 1s after it sends the response
+    time.sleep(1)
     # Send data to out0 from in1:
     client_data = "Hello, are you there UDP?"
-    client_result = runCmd(net, in1, 'echo %s | nc -u %s 12001 -q1' % (client_data, ip(net, out0))) # q1 makes nc quit 1s after sending the packet
-    server_result = waitOutput(net, out0)
-    # Trim newline chars from output
-    if client_result is not None:
-        client_result = client_result.rstrip('\n\r')
-    if server_result is not None:
-        server_result = server_result.rstrip('\n\r')
+    client = start(in1, 'echo %s | nc -u %s 12001 -q1' % (client_data, out0.IP()), timeout=10.0) # q1 makes nc quit 1s after sending the packet
+    wait([server, client])
+    server_result = output(server)
+    client_result = output(client)
     # Print what was received
-    received(out0, server_result)
-    received(in1, client_result)
+    received(out0.name, server_result)
+    received(in1.name, client_result)
     # Check that the received data was correct:
     if (server_result != client_data):
         print "WARNING: incorrect data received on the server"
@@ -171,19 +169,33 @@ def test():
     else:
         print "Correct data received on the client"
 
+    # Test that connections from all the inside hosts, made at the same time, are translated.
+    print ""
+    print "Connecting from all %d inside hosts to %s at the same time:" % (n, out0.name)
+    # Give each inside host its own netcat server on out0, which replies with the host's name.
+    ports = dict((h.name, 12100 + i) for (i, h) in enumerate(inside))
+    servers = [start(out0, 'echo %s | netcat -l %d' % (h.name, ports[h.name])) for h in inside]
+    time.sleep(1)
+    clients = fan_out(inside, lambda h: 'netcat -n %s %d' % (out0.IP(), ports[h.name]), timeout=10.0)
+    for server in servers:
+        server.signal(signal.SIGTERM)
+    failed = [c.node.name for c in clients if output(c) != c.node.name]
+    if failed:
+        print "WARNING: incorrect data received on %s" % ", ".join(failed)
+    else:
+        print "Correct data received on all inside hosts"
+
     # Run scapy test #1
     print ""
     print "Scapy test #1"
     print "  This test checks that a TCP connection can be opened from the inside to the outside and " + \
             "that the connection entry is removed after the inactivity timeout elapses."
-    sendCmd(net, out0, PAX + "/examples/Nat/nat_scapy_tests.py server 35001", xterm=True)
-    runCmd(net, in1, "sleep 1")
-    runCmd(net, in1, PAX + "/examples/Nat/nat_scapy_tests.py client", xterm=True)
-    waitOutput(net, out0)
-    clientExitcode = runCmd(net, in1, "echo $?").rstrip('\n\r')
-    serverExitcode = runCmd(net, out0, "echo $?").rstrip('\n\r')
-    if (clientExitcode != "0" or serverExitcode != "0"):
-        print "WARNING scapy test #1 failed. client %s, server %s" % (clientExitcode, serverExitcode)
+    server = start(out0, setup_xterm(out0, PAX + "/examples/Nat/nat_scapy_tests.py server 35001"))
+    time.sleep(1)
+    client = run_cmd(in1, setup_xterm(in1, PAX + "/examples/Nat/nat_scapy_tests.py client"))
+    wait([server])
+    if (client.exitcode != 0 or server.exitcode != 0):
+        print "WARNING scapy test #1 failed. client %s, server %s" % (client.exitcode, server.exitcode)
     else:
         print "Scapy test #1 passed"
 
@@ -192,31 +204,106 @@ def test():
     print "Scapy test #2"
     print "  This test checks that a TCP connection can be opened from the inside to the outside, and " + \
             "that when it is closed with Fin packets, the connection entry is removed after the TIME_WAIT timeout elapses."
-    sendCmd(net, out0, PAX + "/examples/Nat/nat_scapy_tests.py server2 35002", xterm=True)
-    runCmd(net, in1, "sleep 1")
-    runCmd(net, in1, PAX + "/examples/Nat/nat_scapy_tests.py client2", xterm=True)
-    waitOutput(net, out0)
-    clientExitcode = runCmd(net, in1, "echo $?").rstrip('\n\r')
-    serverExitcode = runCmd(net, out0, "echo $?").rstrip('\n\r')
-    if (clientExitcode != "0" or serverExitcode != "0"):
-        print "WARNING scapy test #2 failed. client %s, server %s" % (clientExitcode, serverExitcode)
+    server = start(out0, setup_xterm(out0, PAX + "/examples/Nat/nat_scapy_tests.py server2 35002"))
+    time.sleep(1)
+    client = run_cmd(in1, setup_xterm(in1, PAX + "/examples/Nat/nat_scapy_tests.py client2"))
+    wait([server])
+    if (client.exitcode != 0 or server.exitcode != 0):
+        print "WARNING scapy test #2 failed. client %s, server %s" % (client.exitcode, server.exitcode)
     else:
         print "Scapy test #2 passed"
 
-    # If we couldn't show the Pax output in a separate window, show it now.
+    # Stop Pax. If we couldn't show its output in a separate window, show it now.
+    pax.interrupt()
+    wait([pax])
     if not config.X_windows:
-        sendInt(net, nat0)
         print "Show Pax output? (y/N)"
         if (sys.stdin.read(1).upper() == "Y"):
-            waitOutput(net, nat0, verbose=True) # Print output
-        else:
-            waitOutput(net, nat0) # Don't print, just wait
+            print pax.output
 
     if config.hold_open:
         CLI(net)
 
     net.stop()
 
+# Start the network, restart Pax in the middle of long-lived TCP and UDP flows, and
+# report how the flows coped. This is done twice: first without a snapshot of the
+# NAT's connection tables (so the flows' mappings are lost when Pax restarts), and
+# then with one (so they should be restored).
+# Before the flows start, some other mappings are set up to use up the first ports
+# that the NAT hands out. Otherwise, after a restart without a snapshot, the NAT
+# would give each flow the same port as before, and the loss of its mapping
+# wouldn't show.
+def test_restart(n=2):
+    "Test restarting the NAT during long-lived flows"
+    net = createNetwork(n)
+
+    nat0 = net.get("nat0")
+    out0 = net.get("out0")
+    udp_client = net.get("in1")
+    tcp_client = net.get("in%d" % n)
+    udp_port, tcp_port, unused_port = 12201, 12202, 12203
+    used_up_mappings = 5
+    snapshot = "/tmp/nat_snapshot.bin"
+
+    results = []
+    for warm in [False, True]:
+        print ""
+        print "Restarting Pax %s a snapshot of the connection tables:" % ("with" if warm else "without")
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+        cmd = PAX + '/Bin/Pax.exe --config=' + wiring(n, snapshot if warm else None) + \
+            ' --code=' + PAX + '/examples/Bin/Examples.dll'
+        pax = start(nat0, cmd)
+        time.sleep(pax_startup_wait)
+
+        # Use up the first ports, then start the flows
+        run_cmd(udp_client, helper_cmd("open_mappings", out0.IP(), unused_port, used_up_mappings), timeout=10.0)
+        duration = config.restart_after + pax_startup_wait + config.recovery_time
+        servers = [start(out0, helper_cmd("udp_echo_server", udp_port, duration + 3)),
+                   start(out0, helper_cmd("tcp_echo_server", tcp_port, duration + 3))]
+        time.sleep(1)
+        clients = [start(udp_client, helper_cmd("udp_load", out0.IP(), udp_port, config.rate, duration, 64, 1.0)),
+                   start(tcp_client, helper_cmd("tcp_load", out0.IP(), tcp_port, config.rate, duration))]
+
+        # Restart Pax in the middle of the flows
+        time.sleep(config.restart_after)
+        print "  Restarting Pax"
+        pax.interrupt()
+        wait([pax])
+        pax = start(nat0, cmd)
+
+        wait(clients + servers)
+        pax.interrupt()
+        wait([pax])
+        restored = False
+        for line in pax.output.splitlines():
+            if "NAT snapshot" in line or line.startswith("Restored"):
+                print "  %s> %s" % (nat0.name, line)
+                restored = restored or line.startswith("Restored")
+        if warm and not restored:
+            print "  WARNING Pax didn't restore the snapshot when it restarted"
+
+        for (protocol, client, server) in [("UDP", clients[0], servers[0]), ("TCP", clients[1], servers[1])]:
+            try:
+                result = parse_result(client.output)
+                result.update(parse_result(server.output))
+            except Exception:
+                print "  WARNING %s flow didn't report a result: %s" % (protocol, client.output)
+                continue
+            results.append((warm, protocol, result))
+            print "  %s: %s of %s messages lost, longest gap %sms, %s source port(s) seen by %s%s" % \
+                (protocol, result["lost"], result["sent"], result["max_gap_ms"], result["source_ports"], out0.name,
+                 ", connection broken" if result.get("broken") == "True" else "")
+
+    print ""
+    print "restart   flow  lost   longest gap (ms)  source ports"
+    for (warm, protocol, result) in results:
+        print "%-8s  %-4s  %-5s  %-16s  %s" % ("warm" if warm else "cold", protocol, result["lost"],
+                                               result["max_gap_ms"], result["source_ports"])
+
+    net.stop()
+
 # List topologies defined in this file for Mininet
 topos = { 'nat': (lambda: NatTopo())}
 
@@ -244,51 +331,35 @@ def setup_xterm(h, cmd, title=None):
         cmd = "stdbuf -i0 -o0 -e0 %s &> %s" % (cmd, pipe) # FIXME for most applications -iL etc. would be enough?
     return cmd
 
-def runCmd(net, name, cmd, timeout=None, xterm=False, **args):
-    "Run a shell command on a specific node in the network and return the output"
-    # Get the Mininet node
-    h = net.get(name)
-    # Print the command so the user knows what's happening
-    print "  %s> $ %s" % (name, cmd)
-
-    # If the output should be in a separate window, set it up
-    if xterm:
-        cmd = setup_xterm(h, cmd)
-
-    if (timeout is None):
-        # If no timeout required, just run the command
-        return h.cmd(cmd, **args)
-    else:
-        # We want the command to timeout if it runs too long.
-        # Start a timer. Send an interrupt when it expires.
-        timer = threading.Timer(timeout, lambda: h.sendInt(chr(4))) # sends ^D
-        timer.start()
-        # Run the command
-        rv = h.cmd(cmd, **args)
-        # Stop the timer (if it hasn't already timed out)
-        timer.cancel()
-        return rv
-
-def sendCmd(net, name, cmd, xterm=False, **args):
-    "Run a shell command on a specific node in the network and don't block waiting for it to finish. The output can be gotten with waitOutput."
-    # Get the Mininet node
-    h = net.get(name)
-    # Print the command so the user knows what's happening
-    print "  %s> $ %s" % (name, cmd)
-
-    # If the output should be in a separate window, set it up
-    if xterm:
-        cmd = setup_xterm(h, cmd)
-
-    # Start the command
-    h.sendCmd(cmd, **args)
-
-def waitOutput(net, name, **args):
-    "Block until the running process on a specific node in the network finishes, and return the output."
-    # Get the Mininet node
-    h = net.get(name)
-    # Block until done, and return the output
-    return h.waitOutput(**args)
+def wiring(n, snapshot_file=None):
+    """Returns the filename of the test wiring configuration, extended if needed to cover `n` inside hosts,
+       and to keep the NAT's connection tables in `snapshot_file` if one is given."""
+    filename = PAX + '/examples/Nat/nat_wiring_test.json'
+    with open(filename) as f:
+        wiring = json.load(f)
+    interfaces = wiring["interfaces"]
+    if len(interfaces) == n+1 and snapshot_file is None:
+        return filename
+    # Wire up the additional inside ports in the same way as the last one,
+    #  and leave out any that don't exist (nat0 has ports 0 to n).
+    for i in range(len(interfaces), n+1):
+        intf = dict(interfaces[-1])
+        intf["interface_name"] = "nat0-eth%d" % i
+        interfaces.append(intf)
+    del interfaces[n+1:]
+    filename = "/tmp/nat_wiring_test_%d.json" % n
+    if snapshot_file is not None:
+        wiring["handlers"][0]["args"]["snapshot_file"] = snapshot_file
+        filename = "/tmp/nat_wiring_test_%d_snapshot.json" % n
+    with open(filename, "w") as f:
+        json.dump(wiring, f, indent=2)
+    return filename
+
+def output(command):
+    "The output of a finished command, with trailing newline chars trimmed, or None if there wasn't any."
+    if command.output == "":
+        return None
+    return command.output.rstrip('\n\r')
 
 def received(name, result):
     "Prints a notification to the user that a value was received on a node in the network."
@@ -297,20 +368,6 @@ def received(name, result):
     else:
         print "  %s> RCV: '%s'" % (name, result)
 
-def ip(net, name, **args):
-    "Gets the IP address of a specific node in the network."
-    # Get the Mininet node
-    h = net.get(name)
-    # Return the IP address
-    return h.IP(**args)
-
-def sendInt(net, name, **args):
-    "Sends an interrupt to a specific node on the network."
-    # Get the Mininet node
-    h = net.get(name)
-    # Send the interrupt
-    h.sendInt(**args)
-
 
 # This code runs when the script is executed (e.g. $ sudo ${PAX}/examples/Nat/nat_topo.py)
 import sys
@@ -321,9 +378,13 @@ if __name__ == '__main__':
     ## Parse CLI arguments
     # Set up the parser
     parser = argparse.ArgumentParser(description="Test the Pax NAT implementation.")
-    parser.add_argument("action", choices=["run", "test"], nargs="?", default="run")
+    parser.add_argument("action", choices=["run", "test", "restart"], nargs="?", default="run")
     parser.add_argument("--no-X", help="don't launch additional windows", action="store_false", dest="X_windows")
     parser.add_argument("--hold-open", help="leave xterm windows open", action="store_true", dest="hold_open")
+    parser.add_argument("-n", help="number of inside hosts", type=int, default=2)
+    parser.add_argument("--restart-after", help="seconds into the flows to restart Pax, for the restart test", type=int, default=5, dest="restart_after")
+    parser.add_argument("--recovery-time", help="seconds to keep the flows going after Pax has restarted, for the restart test", type=int, default=10, dest="recovery_time")
+    parser.add_argument("--rate", help="messages per second sent by each flow in the restart test", type=int, default=50)
     parser.add_argument("--cli-first", help="provide cli access before starting pax and running the tests. Press ^D when done to begin the testing.", action="store_true", dest="cli_first")
 
     # Parse
@@ -333,8 +394,10 @@ if __name__ == '__main__':
 
     # Run the specified action
     if config.action == "run":
-        run()
+        run(config.n)
     elif config.action == "test":
-        test()
+        test(config.n)
+    elif config.action == "restart":
+        test_restart(config.n)
     else:
         print "Unknown action"
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# coding: latin-1
+
+"""
+pax_capture_sweep.py: runs a Pax benchmark on Mininet across a grid of capture
+settings (the per-interface tuning knobs in the wiring configuration), and
+reports the settings that are Pareto-optimal for throughput, latency and CPU use.
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+
+Example:
+  $ sudo -E ./mininet/pax_capture_sweep.py nat --kernel-buffer-size 0,4194304 --immediate-mode false,true
+
+The same file also contains the Ethernet load generators that the sweep runs on
+the Mininet hosts for the echo benchmark (see the "helper" actions below); the
+UDP ones are in pax_mininet_traffic.py.
+"""
+
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+import argparse
+import itertools
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+PAX = None
+try:
+  PAX = os.environ['PAX']
+except KeyError:
+  print "PAX environment variable must point to path where Pax repo is cloned"
+  exit(1)
+
+sys.path.insert(0, PAX + "/mininet/")
+sys.path.insert(0, PAX + "/examples/Nat/")
+from pax_mininet_node import PaxNode
+from pax_mininet_traffic import percentile, report, parse_result, helper_cmd, start_pax, stop_pax, cpu_seconds, pax_startup_wait
+
+# The capture settings we sweep over, and how to parse values for them from the command line.
+KNOBS = [
+  ("read_timeout", int),
+  ("kernel_buffer_size", int),
+  ("snaplen", int),
+  ("immediate_mode", lambda s: s.lower() in ["true", "1", "yes"]),
+  ("promiscuous", lambda s: s.lower() in ["true", "1", "yes"]),
+]
+
+# FIXME duplicated hardcoded configuration info (see examples/EthernetEcho/)
+host_mac = "02:00:00:00:00:02"
+echoer_mac = "02:00:00:00:00:01"
+host_iface_name = "host-eth0"
+ETH_P_PAXBENCH = 0x9000
+PACKET_OUTGOING = 4
+
+udp_port = 12031
+
+
+## Load generators. These run on the Mininet hosts.
+
+def echo_socket(iface):
+  s = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_PAXBENCH))
+  s.bind((iface, ETH_P_PAXBENCH))
+  return s
+
+def echo_frame(seq, size):
+  header = (echoer_mac.replace(":", "").decode("hex") + host_mac.replace(":", "").decode("hex") +
+            struct.pack("!H", ETH_P_PAXBENCH))
+  payload = struct.pack("!Q", seq)
+  return header + payload + "\0" * max(0, size - len(header) - len(payload))
+
+def echo_recv_seq(s):
+  "Returns the sequence number in an echoed frame, or None if the frame wasn't an echo."
+  data, addr = s.recvfrom(65536)
+  # Skip our own frames, which the socket also sees.
+  if addr[2] == PACKET_OUTGOING or len(data) < 22:
+    return None
+  return struct.unpack("!Q", data[14:22])[0]
+
+def helper_echo_load(iface, duration, size):
+  "Sends frames to EthernetEcho as fast as possible, and counts the echoes."
+  s = echo_socket(iface)
+  s.settimeout(1.0)
+  sent = [0]
+  def send():
+    end = time.time() + duration
+    while time.time() < end:
+      s.send(echo_frame(sent[0], size))
+      sent[0] += 1
+  sender = threading.Thread(target=send)
+  sender.start()
+  received = 0
+  while True:
+    try:
+      if echo_recv_seq(s) is not None:
+        received += 1
+    except socket.timeout:
+      if not sender.is_alive():
+        break
+  sender.join()
+  report(sent=sent[0], received=received, pps=received / float(duration))
+
+def helper_echo_rtt(iface, count, size, timeout):
+  "Sends frames to EthernetEcho one at a time, and measures the time until each echo arrives."
+  s = echo_socket(iface)
+  rtts = []
+  for seq in range(count):
+    s.settimeout(timeout)
+    start = time.time()
+    s.send(echo_frame(seq, size))
+    try:
+      while echo_recv_seq(s) != seq:
+        pass
+      rtts.append((time.time() - start) * 1e6)
+    except socket.timeout:
+      pass
+  report(lost=count - len(rtts), p50_us=percentile(rtts, 50), p99_us=percentile(rtts, 99))
+
+
+## The sweep. This runs on the Mininet controller.
+
+def as_float(v):
+  return None if v in [None, "None"] else float(v)
+
+def write_wiring(base_filename, settings, extra_interface_settings={}, handler_args={}):
+  "Writes a copy of the base wiring configuration, with the settings applied to every interface, and returns its filename."
+  with open(base_filename) as f:
+    wiring = json.load(f)
+  for handler in wiring["handlers"]:
+    handler["args"].update(handler_args)
+  for intf in wiring["interfaces"]:
+    intf.update(extra_interface_settings)
+    intf.update(settings)
+  fd, filename = tempfile.mkstemp(prefix="pax_sweep_", suffix=".json")
+  with os.fdopen(fd, "w") as f:
+    json.dump(wiring, f, indent=2)
+  return filename
+
+def measure(pax, run_load):
+  "Runs the load generator, and returns its results along with the CPU used by Pax meanwhile."
+  cpu_before = cpu_seconds(pax.pid)
+  wall_before = time.time()
+  result = run_load()
+  result["cpu_pct"] = 100 * (cpu_seconds(pax.pid) - cpu_before) / (time.time() - wall_before)
+  return result
+
+def run_echo(settings, config):
+  "Runs the EthernetEcho benchmark using the given settings, and returns (throughput, latency, cpu)."
+  net = Mininet()
+  echoer = net.addHost('echoer', mac=echoer_mac, cls=PaxNode)
+  host = net.addHost('host', mac=host_mac)
+  switch = net.addSwitch('s0')
+  net.addController('c0')
+  net.addLink(echoer, switch)
+  net.addLink(host, switch)
+  net.start()
+
+  # Only let Pax see frames sent to it, otherwise it would also echo the frames that it sends.
+  # EthernetEcho queues frames and passes them on using timers. At their default intervals
+  # (10ms and 20ms) the timers would account for most of the round-trip time, hiding the
+  # effect of the capture settings, so run them as often as they can go. Timer delays of
+  # up to a couple of milliseconds remain in the echo latency.
+  wiring = write_wiring(PAX + "/examples/EthernetEcho/ethernet_echo.json", settings,
+                        {"pcap_filter": "ether dst %s and ether proto 0x%x" % (echoer_mac, ETH_P_PAXBENCH)},
+                        {"processor_interval": "1", "sender_interval": "1"})
+  pax = start_pax(echoer, wiring)
+  try:
+    time.sleep(pax_startup_wait)
+    load = measure(pax, lambda: parse_result(host.cmd(helper_cmd("echo_load", host_iface_name,
+                                                                 config.duration, config.size,
+                                                                 script=__file__))))
+    rtt = parse_result(host.cmd(helper_cmd("echo_rtt", host_iface_name, config.probes,
+                                           config.size, config.probe_timeout, script=__file__)))
+  finally:
+    stop_pax(pax)
+    os.remove(wiring)
+    net.stop()
+
+  return (float(load["pps"]), as_float(rtt[config.latency_metric]), load["cpu_pct"])
+
+def run_nat(settings, config):
+  "Runs the NAT benchmark using the given settings, and returns (throughput, latency, cpu)."
+  from nat_topo import NatTopo
+  net = Mininet(topo=NatTopo(n=2))
+  net.start()
+  nat0, in1, out0 = net.get("nat0"), net.get("in1"), net.get("out0")
+  for i in range(1, 3):
+    net.get("in%d" % i).setDefaultRoute('via 192.168.1.1')
+
+  wiring = write_wiring(PAX + "/examples/Nat/nat_wiring.json", settings)
+  pax = start_pax(nat0, wiring)
+  try:
+    time.sleep(pax_startup_wait)
+    out0.cmd("iperf -s &")
+    time.sleep(1)
+    def iperf():
+      # Using -y C, the last field of the report is the throughput in bits/sec.
+      output = in1.cmd("iperf -c %s -t %d -y C" % (out0.IP(), config.duration)).strip()
+      return {"bps": output.splitlines()[-1].split(",")[-1] if output else "0"}
+    load = measure(pax, iperf)
+    out0.cmd("kill %iperf")
+
+    out0.cmd(helper_cmd("udp_echo_server", udp_port,
+                        config.probes * config.probe_timeout + pax_startup_wait) + " > /dev/null &")
+    time.sleep(1)
+    rtt = parse_result(in1.cmd(helper_cmd("udp_rtt", out0.IP(), udp_port, config.probes,
+                                          config.size, config.probe_timeout)))
+  finally:
+    stop_pax(pax)
+    os.remove(wiring)
+    net.stop()
+
+  return (float(load["bps"]), as_float(rtt[config.latency_metric]), load["cpu_pct"])
+
+def dominates(a, b):
+  "Whether result a is at least as good as b in all respects (more throughput, less latency, less CPU) and better in one."
+  (_, a_tput, a_lat, a_cpu) = a
+  (_, b_tput, b_lat, b_cpu) = b
+  # A run in which every latency probe was lost is as bad as it gets.
+  a_lat = float("inf") if a_lat is None else a_lat
+  b_lat = float("inf") if b_lat is None else b_lat
+  no_worse = a_tput >= b_tput and a_lat <= b_lat and a_cpu <= b_cpu
+  better = a_tput > b_tput or a_lat < b_lat or a_cpu < b_cpu
+  return no_worse and better
+
+def pareto_front(results):
+  return [r for r in results if not any(dominates(other, r) for other in results)]
+
+def sweep(config):
+  names = [name for (name, _) in KNOBS if getattr(config, name) is not None]
+  grid = [[parse(v) for v in getattr(config, name).split(",")]
+          for (name, parse) in KNOBS if getattr(config, name) is not None]
+  run = run_echo if config.benchmark == "echo" else run_nat
+  throughput_unit = "pps" if config.benchmark == "echo" else "bps"
+
+  results = []
+  for values in itertools.product(*grid):
+    settings = dict(zip(names, values))
+    print "Running %s benchmark with %s" % (config.benchmark, settings)
+    for repetition in range(config.repeat):
+      (tput, lat, cpu) = run(settings, config)
+      print "  throughput %s %s, %s latency %s us, CPU %.1f%%" % \
+        (tput, throughput_unit, config.latency_metric, lat, cpu)
+      results.append((settings, tput, lat, cpu))
+
+  if config.output is not None:
+    with open(config.output, "w") as f:
+      f.write(",".join(names + ["throughput_" + throughput_unit, "latency_" + config.latency_metric, "cpu_pct"]) + "\n")
+      for (settings, tput, lat, cpu) in results:
+        f.write(",".join([str(settings[n]) for n in names] + [str(tput), str(lat), str(cpu)]) + "\n")
+
+  print ""
+  print "Pareto front (throughput %s, %s latency us, CPU %%):" % (throughput_unit, config.latency_metric)
+  for (settings, tput, lat, cpu) in sorted(pareto_front(results), key=lambda r: -r[1]):
+    print "  %s %s %.1f  %s" % (tput, lat, cpu, json.dumps(settings, sort_keys=True))
+
+
+# This code runs when the script is executed (e.g. $ sudo -E ${PAX}/mininet/pax_capture_sweep.py nat)
+if __name__ == '__main__':
+  if len(sys.argv) > 1 and sys.argv[1] == "echo_load":
+    helper_echo_load(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+  elif len(sys.argv) > 1 and sys.argv[1] == "echo_rtt":
+    helper_echo_rtt(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5]))
+  else:
+    setLogLevel('warning')
+
+    parser = argparse.ArgumentParser(description="Sweep Pax's capture settings and report the Pareto front.")
+    parser.add_argument("benchmark", choices=["echo", "nat"])
+    for (name, _) in KNOBS:
+      parser.add_argument("--" + name.replace("_", "-"), dest=name,
+                          help="comma-separated values of %s to try" % name)
+    parser.add_argument("--duration", type=int, default=10, help="seconds of load for each throughput measurement")
+    parser.add_argument("--size", type=int, default=64, help="size in bytes of the frames/datagrams sent")
+    parser.add_argument("--probes", type=int, default=200, help="number of latency probes")
+    parser.add_argument("--probe-timeout", type=float, default=1.0, dest="probe_timeout")
+    parser.add_argument("--latency-metric", choices=["p50_us", "p99_us"], default="p99_us", dest="latency_metric")
+    parser.add_argument("--repeat", type=int, default=1, help="number of runs for each combination of settings")
+    parser.add_argument("--output", help="write all results to this CSV file")
+
+    sweep(parser.parse_args())
@@ -0,0 +1,168 @@
+# coding: latin-1
+
+"""
+pax_mininet_cmd.py: Runs shell commands on Mininet nodes concurrently.
+
+Unlike Node.cmd and Node.sendCmd, which share the node's single shell and so
+can only run one command at a time per node (and block the caller until it
+finishes), each command here runs in its own process inside the node's
+namespaces. Any number of commands, on any number of nodes, can be running at
+once; their output is collected without blocking, timeouts kill the command,
+and each command's exit code is kept.
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+"""
+
+import os
+import select
+import signal
+import subprocess
+import time
+
+# Commands that have been started and haven't finished yet. Their output is
+# collected whenever we wait for any command, so that a command that nobody is
+# waiting on (e.g., a server running in the background) can't block on a full pipe.
+_running = []
+
+# Seconds that a command is given to stop after SIGTERM, once it's timed out,
+# before it's sent SIGKILL.
+kill_grace_period = 2.0
+
+class Command(object):
+    "Command: A shell command running on a Mininet node."
+
+    def __init__(self, node, cmd, timeout=None, verbose=False):
+        self.node = node
+        self.cmd = cmd
+        self.timeout = timeout
+        # Whether to print the command's output as it arrives.
+        self.verbose = verbose
+
+        self.proc = None
+        self.deadline = None
+        self.kill_deadline = None
+        self.exitcode = None
+        self.timed_out = False
+        self.killed = False
+        self._chunks = []
+        self._partial_line = ""
+        self._eof = False
+
+    def start(self):
+        # mnexec -d runs the command in a new session, so that on timeout we can
+        #  kill it along with any processes it started.
+        self.proc = self.node.popen(["bash", "-c", self.cmd],
+                                    stdin=open(os.devnull), stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+        if self.timeout is not None:
+            self.deadline = time.time() + self.timeout
+        _running.append(self)
+        return self
+
+    def fileno(self):
+        return self.proc.stdout.fileno()
+
+    @property
+    def finished(self):
+        return self.exitcode is not None
+
+    @property
+    def output(self):
+        "The output received so far."
+        return "".join(self._chunks)
+
+    def signal(self, sig):
+        "Sends a signal to the command and everything it started."
+        try:
+            os.killpg(self.proc.pid, sig)
+        except OSError:
+            # It has already finished.
+            pass
+
+    def interrupt(self):
+        self.signal(signal.SIGINT)
+
+    def _read(self):
+        data = os.read(self.fileno(), 4096)
+        if data == "":
+            self._eof = True
+            if self.verbose and self._partial_line != "":
+                self._print_line(self._partial_line)
+            return
+        self._chunks.append(data)
+        if self.verbose:
+            lines = (self._partial_line + data).split("\n")
+            self._partial_line = lines.pop()
+            for line in lines:
+                self._print_line(line)
+
+    def _print_line(self, line):
+        print "  %s> %s" % (self.node.name, line.rstrip("\r"))
+
+    def _check(self, now):
+        "Enforces the timeout, and notices if the command has finished."
+        if self.deadline is not None and now >= self.deadline and not self.timed_out:
+            self.timed_out = True
+            self.signal(signal.SIGTERM)
+            self.kill_deadline = now + kill_grace_period
+        if self.timed_out and not self.killed and now >= self.kill_deadline:
+            # It ignored SIGTERM, or is taking too long to stop.
+            self.killed = True
+            self.signal(signal.SIGKILL)
+        # Once a command has timed out, it's finished when it has exited, even if
+        #  something it started (outside its process group) still holds its output open.
+        if (self._eof or self.timed_out) and self.proc.poll() is not None:
+            self.exitcode = self.proc.returncode
+            self.proc.stdout.close()
+            _running.remove(self)
+
+    def _next_deadline(self):
+        "The next time at which _check has something to enforce, or None."
+        if not self.timed_out:
+            return self.deadline
+        if not self.killed:
+            return self.kill_deadline
+        return None
+
+def start(node, cmd, timeout=None, verbose=False):
+    "Start a shell command on a node, and return the Command without waiting for it to finish."
+    # Print the command so the user knows what's happening
+    print "  %s> $ %s" % (node.name, cmd)
+    return Command(node, cmd, timeout=timeout, verbose=verbose).start()
+
+def wait(commands):
+    "Block until all the given commands have finished (or timed out), and return them."
+    while not all(c.finished for c in commands):
+        now = time.time()
+        for c in list(_running):
+            c._check(now)
+
+        # Use poll rather than select, since select can't handle descriptors
+        #  numbered above FD_SETSIZE (1024), which large networks reach.
+        poller = select.poll()
+        reading = {}
+        for c in _running:
+            if not c._eof:
+                reading[c.fileno()] = c
+                poller.register(c.fileno(), select.POLLIN)
+        # Wake up in time for the next deadline, and check regularly for
+        #  commands that have closed their output but not yet exited.
+        wake = 0.1
+        deadlines = [d - now for d in (c._next_deadline() for c in _running) if d is not None]
+        if deadlines:
+            wake = max(0, min([wake] + deadlines))
+        for (fd, event) in poller.poll(wake * 1000):
+            # POLLHUP without POLLIN is how the end of the output shows up.
+            reading[fd]._read()
+    return commands
+
+def run(node, cmd, timeout=None, verbose=False):
+    "Run a shell command on a node, wait for it to finish, and return the Command."
+    return wait([start(node, cmd, timeout=timeout, verbose=verbose)])[0]
+
+def fan_out(nodes, cmd, timeout=None, verbose=False):
+    """Start a shell command on each of the nodes at the same time, then wait for them all.
+       `cmd` is either a string, or a function from a node to a string."""
+    commands = [start(node, cmd(node) if callable(cmd) else cmd, timeout=timeout, verbose=verbose)
+                for node in nodes]
+    return wait(commands)
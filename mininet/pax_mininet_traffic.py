@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# coding: latin-1
+
+"""
+pax_mininet_traffic.py: Traffic generators and measurement helpers for running
+Pax experiments on Mininet.
+
+The "helper" functions below run on the Mininet hosts, as separate processes
+started using helper_cmd (e.g., through pax_mininet_cmd.start, or Node.cmd).
+They report their results on a line of the form
+  RESULT key=value key=value ...
+which parse_result turns back into a dictionary on the Mininet controller.
+
+The remaining functions run on the controller: they start and stop Pax on a
+node, and measure how much CPU time it uses.
+
+Use of this source code is governed by the Apache 2.0 license; see LICENSE.
+"""
+
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+# Time given to Pax to start up before we start sending traffic.
+pax_startup_wait = 6
+
+
+## Reporting results.
+
+def percentile(samples, p):
+    "Returns the p-th percentile of a list of samples, or None if there aren't any."
+    if len(samples) == 0:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))]
+
+def report(**results):
+    "Prints results in the form that parse_result parses."
+    print "RESULT " + " ".join("%s=%s" % (k, v) for (k, v) in sorted(results.items()))
+    sys.stdout.flush()
+
+def parse_result(output):
+    "Parses the output of report()."
+    for line in output.splitlines():
+        if line.startswith("RESULT "):
+            return dict(kv.split("=", 1) for kv in line.split()[1:])
+    raise Exception("No result in output: %s" % output)
+
+def helper_cmd(action, *args, **kwargs):
+    """The shell command that runs one of the helpers below on a host. A script with helpers
+       of its own can run one of those instead by passing script=__file__."""
+    script = kwargs.get("script", __file__)
+    return "python %s %s %s" % (os.path.abspath(script), action, " ".join(str(a) for a in args))
+
+
+## Helpers. These run on the Mininet hosts.
+
+def max_gap_ms(start, times, end):
+    "The longest time between start, each of the times, and end."
+    points = [start] + sorted(times) + [end]
+    return int(max(b - a for (a, b) in zip(points, points[1:])) * 1000)
+
+def send_at_rate(send, rate, duration):
+    """Calls send(seq) at the given rate, whether or not earlier messages have been answered, and returns
+       (the number of messages sent, the time sending started). Stops early if send returns False."""
+    start = time.time()
+    count = int(rate * duration)
+    for seq in range(count):
+        delay = start + seq / float(rate) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        if not send(seq):
+            return (seq, start)
+    return (count, start)
+
+def helper_udp_echo_server(port, duration):
+    """Echoes UDP datagrams back to their sender. When it finishes it reports how many different
+       source addresses the datagrams came from: if a NAT forgets a flow's mapping, the flow
+       shows up from a new port."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("", port))
+    s.settimeout(1.0)
+    sources = set()
+    end = time.time() + duration
+    while time.time() < end:
+        try:
+            data, addr = s.recvfrom(65536)
+        except socket.timeout:
+            continue
+        sources.add(addr)
+        s.sendto(data, addr)
+    report(source_ports=len(sources))
+
+def helper_tcp_echo_server(port, duration):
+    "Echoes what it receives on each TCP connection, and reports how many different source addresses connected."
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("", port))
+    listener.listen(5)
+    listener.settimeout(1.0)
+    sources = set()
+    end = time.time() + duration
+
+    def echo(conn):
+        conn.settimeout(1.0)
+        while time.time() < end:
+            try:
+                data = conn.recv(4096)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            if not data:
+                break
+            conn.sendall(data)
+        conn.close()
+
+    while time.time() < end:
+        try:
+            conn, addr = listener.accept()
+        except socket.timeout:
+            continue
+        sources.add(addr)
+        t = threading.Thread(target=echo, args=(conn,))
+        t.daemon = True
+        t.start()
+    report(source_ports=len(sources))
+
+def helper_udp_rtt(host, port, count, size, timeout):
+    "Sends UDP datagrams to helper_udp_echo_server one at a time, and measures the time until each reply arrives."
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(timeout)
+    rtts = []
+    for seq in range(count):
+        payload = struct.pack("!Q", seq) + "\0" * max(0, size - 8)
+        start = time.time()
+        s.sendto(payload, (host, port))
+        try:
+            while struct.unpack("!Q", s.recv(65536)[:8])[0] != seq:
+                pass
+            rtts.append((time.time() - start) * 1e6)
+        except socket.timeout:
+            pass
+    report(lost=count - len(rtts), p50_us=percentile(rtts, 50), p99_us=percentile(rtts, 99))
+
+def helper_udp_load(host, port, rate, duration, size, timeout):
+    """Sends UDP datagrams to helper_udp_echo_server at a fixed rate, and measures the round-trip time of each.
+       Since the sender doesn't wait for replies, a pause on the path shows up in the tail of the latencies,
+       and in max_gap_ms: the longest time that the flow went without a reply."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.connect((host, port))
+    s.settimeout(0.1)
+    received = {}
+    rtts = []
+    sending = [True]
+
+    def receive():
+        end = None
+        while end is None or time.time() < end:
+            if end is None and not sending[0]:
+                # Give the last replies time to arrive.
+                end = time.time() + timeout
+            try:
+                data = s.recv(65536)
+            except socket.timeout:
+                continue
+            except socket.error:
+                # E.g. an ICMP error from an earlier datagram.
+                continue
+            now = time.time()
+            (seq, sent_at) = struct.unpack("!Qd", data[:16])
+            received[seq] = now
+            rtts.append((now - sent_at) * 1e6)
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    padding = "\0" * max(0, size - 16)
+
+    def send(seq):
+        try:
+            s.send(struct.pack("!Qd", seq, time.time()) + padding)
+        except socket.error:
+            pass
+        return True
+
+    (sent, start) = send_at_rate(send, rate, duration)
+    sending[0] = False
+    receiver.join()
+
+    report(sent=sent, received=len(received), lost=sent - len(received),
+           max_gap_ms=max_gap_ms(start, received.values(), start + duration),
+           p50_us=percentile(rtts, 50), p99_us=percentile(rtts, 99), p999_us=percentile(rtts, 99.9))
+
+def helper_tcp_load(host, port, rate, duration):
+    """Sends numbered messages over a TCP connection to helper_tcp_echo_server at a fixed rate, and keeps track
+       of which ones are echoed. As well as what helper_udp_load reports, this reports whether the connection broke."""
+    message_format = "!Q"
+    message_size = struct.calcsize(message_format)
+    s = socket.create_connection((host, port), timeout=10.0)
+    # Block when sending, so that a message is never partly sent. The messages
+    # are small enough that the send buffer won't fill during the test.
+    s.settimeout(None)
+    received = {}
+    broken = [False]
+    sending = [True]
+
+    def receive():
+        buf = ""
+        end = None
+        while end is None or time.time() < end:
+            if end is None and not sending[0]:
+                end = time.time() + 1.0
+            if not select.select([s], [], [], 0.1)[0]:
+                continue
+            try:
+                data = s.recv(4096)
+            except socket.error:
+                broken[0] = True
+                return
+            if not data:
+                broken[0] = True
+                return
+            buf += data
+            while len(buf) >= message_size:
+                received[struct.unpack(message_format, buf[:message_size])[0]] = time.time()
+                buf = buf[message_size:]
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+
+    def send(seq):
+        if broken[0]:
+            return False
+        try:
+            s.sendall(struct.pack(message_format, seq))
+        except socket.error:
+            broken[0] = True
+            return False
+        return True
+
+    (sent, start) = send_at_rate(send, rate, duration)
+    sending[0] = False
+    receiver.join()
+    s.close()
+    report(sent=sent, received=len(received), lost=sent - len(received),
+           max_gap_ms=max_gap_ms(start, received.values(), start + duration), broken=broken[0])
+
+def helper_open_mappings(host, port, count):
+    """Sends a UDP datagram and a TCP SYN from each of `count` new sockets to host:port, so that a NAT on the way
+       sets up that many mappings for each protocol. Nothing needs to be listening on the port."""
+    for _ in range(count):
+        u = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        u.sendto("\0", (host, port))
+        u.close()
+        t = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        t.settimeout(1.0)
+        try:
+            t.connect((host, port))
+        except socket.error:
+            # Usually refused, since nothing's listening.
+            pass
+        t.close()
+
+## Running Pax. These run on the Mininet controller.
+
+def start_pax(node, wiring_filename, code_filename=None, output_filename=None):
+    """Starts Pax quietly on a node, and returns the process. Pax's output is written to
+       output_filename if one is given, and discarded otherwise."""
+    pax = os.environ['PAX']
+    if code_filename is None:
+        code_filename = pax + "/examples/Bin/Examples.dll"
+    cmd = [pax + "/Bin/Pax.exe", "--config=" + wiring_filename, "--code=" + code_filename, "-q"]
+    print "  %s> $ %s" % (node.name, " ".join(cmd))
+    # Don't send the output to a pipe, since nothing reads it while Pax runs and
+    #  Pax would block once the pipe fills.
+    output = open(os.devnull if output_filename is None else output_filename, "w")
+    return node.popen(cmd, stdin=subprocess.PIPE, stdout=output, stderr=subprocess.STDOUT)
+
+def stop_pax(pax):
+    "Stops Pax, giving it a few seconds to shut down cleanly before killing it."
+    pax.send_signal(signal.SIGTERM)
+    for _ in range(10):
+        if pax.poll() is not None:
+            return
+        time.sleep(0.5)
+    pax.kill()
+    pax.wait()
+
+def cpu_seconds(pid):
+    "Returns the CPU time (user and system) used so far by a process."
+    with open("/proc/%d/stat" % pid) as f:
+        # Skip past the command name, which might contain spaces.
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of the stat file.
+    return (int(fields[11]) + int(fields[12])) / float(os.sysconf("SC_CLK_TCK"))
+
+
+def usage():
+    print "Usage: %s udp_echo_server|tcp_echo_server <port> <duration>" % sys.argv[0]
+    print "       %s udp_rtt <host> <port> <count> <size> <timeout>" % sys.argv[0]
+    print "       %s udp_load <host> <port> <rate> <duration> <size> <timeout>" % sys.argv[0]
+    print "       %s tcp_load <host> <port> <rate> <duration>" % sys.argv[0]
+    print "       %s open_mappings <host> <port> <count>" % sys.argv[0]
+
+# This code runs when a helper is started on a host (e.g. $ python ${PAX}/mininet/pax_mininet_traffic.py udp_echo_server 12031 30)
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == "udp_echo_server":
+        helper_udp_echo_server(int(sys.argv[2]), float(sys.argv[3]))
+    elif len(sys.argv) == 4 and sys.argv[1] == "tcp_echo_server":
+        helper_tcp_echo_server(int(sys.argv[2]), float(sys.argv[3]))
+    elif len(sys.argv) == 7 and sys.argv[1] == "udp_rtt":
+        helper_udp_rtt(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]), float(sys.argv[6]))
+    elif len(sys.argv) == 8 and sys.argv[1] == "udp_load":
+        helper_udp_load(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]), float(sys.argv[5]),
+                        int(sys.argv[6]), float(sys.argv[7]))
+    elif len(sys.argv) == 6 and sys.argv[1] == "tcp_load":
+        helper_tcp_load(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]), float(sys.argv[5]))
+    elif len(sys.argv) == 5 and sys.argv[1] == "open_mappings":
+        helper_open_mappings(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        usage()
+        sys.exit(2)